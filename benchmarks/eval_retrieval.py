@@ -0,0 +1,372 @@
+"""Retrieval quality vs speed evaluation for index and model settings.
+
+Embeds the rules from `data/` with each embedding model once, then scores
+every configuration on a labeled question -> expected paragraphs set:
+
+- `exact`: brute-force cosine search over a float32 matrix,
+  same as the local vector backend;
+- `hnsw`: Chroma HNSW index (in-process `EphemeralClient`)
+  for each `M` / `ef` combination;
+- `bm25`: the lexical index, as a baseline without embeddings;
+- every embedding dimension in `dims`: vectors truncated to the first
+  `dim` components and renormalized.
+
+Reports recall@k, hit@k and MRR, p50/p95 search latency, query embedding
+latency of the model and index memory, and writes them as JSON.
+For BM25 it also reports how often the hybrid mode's lexical fast path
+skips embedding and how often its top hit is then right; the run fails if
+the fast path serves fewer than `min_exact_fast_path` of the known-item
+questions, which match a paragraph word for word.
+
+The labeled set is `benchmarks/eval_questions.jsonl` (handwritten questions)
+plus an auto-generated known-item set: the opening words of every rule
+paragraph as a query for that paragraph.
+
+Example:
+```
+python benchmarks/eval_retrieval.py \
+--models=intfloat/multilingual-e5-large,intfloat/multilingual-e5-small \
+--dims=1024,512,256 --hnsw_m=16,32 --hnsw_ef=10,100
+```
+"""
+import json
+import logging
+import os
+import sys
+import time
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+import numpy as np
+
+PATH_PROJECT = Path(__file__).resolve().parents[1]
+PATH_BENCHMARKS = Path(__file__).resolve().parent
+sys.path.insert(0, str(PATH_PROJECT / "src"))
+os.environ.setdefault("CHROMA_PORT", "8000")
+os.environ.setdefault("EMBEDDING_DIMENSION", "1024")
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Labeled = List[Tuple[str, Set[str]]]
+
+
+def load_fragments(pdf_rules_path: str, txt_comments_path: str) -> Tuple[
+        List[str], List[str], List[Dict[str, Any]]]:
+    """Rule fragments as the vector store keeps them: ids, texts and metadata."""
+    from database.text_processor import load_txt_fragments, split_into_fragments
+
+    ids, documents, metadatas = [], [], []
+    for fragment in chain(
+            split_into_fragments(data_path=pdf_rules_path),
+            load_txt_fragments(txt_comments_path, paragraph="Комментарий СК ФСМ")):
+        chroma_dict = fragment.to_chroma_dict()
+        ids.append(chroma_dict["paragraph"])
+        documents.append(chroma_dict["content"])
+        metadatas.append(chroma_dict["metadata"])
+    return ids, documents, metadatas
+
+
+def load_labeled_set(path: str, ids: List[str]) -> Labeled:
+    """Handwritten questions, skipping paragraphs missing from the rules."""
+    known = set(ids)
+    labeled = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            expected = set(item["paragraphs"]) & known
+            if expected:
+                labeled.append((item["question"], expected))
+            else:
+                logger.warning("No known paragraphs for %r", item["question"])
+    return labeled
+
+
+def auto_labeled_set(ids: List[str], documents: List[str],
+                     n_words: int = 12, min_words: int = 6) -> Labeled:
+    """Known-item questions: the opening words of each numbered paragraph."""
+    labeled = []
+    for id_, document in zip(ids, documents):
+        words = document.split()
+        if id_[0].isdigit() and len(words) >= min_words:
+            labeled.append((' '.join(words[:n_words]), {id_}))
+    return labeled
+
+
+def truncate(vectors: np.ndarray, dim: int) -> np.ndarray:
+    """First `dim` components, renormalized so dot product stays cosine."""
+    vectors = vectors[:, :dim]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def rss_mb() -> float:
+    """Current resident memory, 0 where /proc is not available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return 0.0
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class ExactIndex:
+    """Brute-force search, the baseline every approximate index is held to."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def search(self, vector: np.ndarray, k: int) -> List[int]:
+        scores = self.vectors @ vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+    def memory_mb(self) -> float:
+        return self.vectors.nbytes / (1024 * 1024)
+
+
+class HnswIndex:
+    """Chroma HNSW index with the same distance as the production collection."""
+
+    def __init__(self, vectors: np.ndarray, m: int, ef: int,
+                 construction_ef: int = 100, batch_size: int = 512):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.m, self.dim, self.size = m, vectors.shape[1], len(vectors)
+        client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False))
+        name = f"eval_m{m}_ef{ef}_d{self.dim}"
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+        self.collection = client.create_collection(
+            name, embedding_function=None, metadata={
+                "hnsw:M": m,
+                "hnsw:search_ef": ef,
+                "hnsw:construction_ef": construction_ef,
+            })
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            self.collection.add(
+                ids=[str(row) for row in range(start, start + len(batch))],
+                embeddings=batch.tolist())
+
+    def search(self, vector: np.ndarray, k: int) -> List[int]:
+        results = self.collection.query(
+            query_embeddings=[vector.tolist()], n_results=k, include=[])
+        return [int(id_) for id_ in results["ids"][0]]
+
+    def memory_mb(self) -> float:
+        # Vectors plus the base layer links, upper layers add about 1/M more
+        links = self.size * 2 * self.m * 4 * (1 + 1 / self.m)
+        return (self.size * self.dim * 4 + links) / (1024 * 1024)
+
+
+class LexicalSearch:
+    """BM25 over the same fragments, queried with raw text."""
+
+    def __init__(self, ids, documents, metadatas):
+        from database.lexical_index import LexicalIndex
+        self.index = LexicalIndex.build(ids, documents, metadatas)
+
+    def search(self, query: str, k: int) -> List[int]:
+        return [row for row, _, _ in self.index.search(query, k=k)]
+
+    def fast_path(self, labeled: Labeled, ids: List[str],
+                  k: int = 3) -> Dict[str, float]:
+        """Share of questions answered by the hybrid lexical fast path,
+        and hit@1 among them."""
+        from consts import HYBRID_CANDIDATES
+        from database.fragments_db import RAGInterface
+
+        served = hits = 0
+        for question, expected in labeled:
+            found = self.index.search(question, k=HYBRID_CANDIDATES)
+            if RAGInterface._is_confident(
+                    [{"relevance_score": confidence} for _, _, confidence in found], k):
+                served += 1
+                hits += ids[found[0][0]] in expected
+        return {"fast_path_share": served / len(labeled),
+                "fast_path_hit@1": hits / served if served else 0.0}
+
+    def memory_mb(self) -> float:
+        arrays = (self.index.offsets, self.index.doc_ids, self.index.term_freqs,
+                  self.index.idf, self.index.doc_lengths)
+        return sum(array.nbytes for array in arrays) / (1024 * 1024)
+
+
+def score(index, queries: List[Any], labeled: Labeled, ids: List[str],
+          ks: List[int]) -> Dict[str, float]:
+    """Recall@k, hit@k, MRR and search latency of an index on a labeled set."""
+    depth = max(max(ks), 10)
+    recall = {k: 0.0 for k in ks}
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks, latencies = [], []
+    for query, (_, expected) in zip(queries, labeled):
+        start = time.perf_counter()
+        rows = index.search(query, depth)
+        latencies.append(time.perf_counter() - start)
+        retrieved = [ids[row] for row in rows]
+        for k in ks:
+            found = expected.intersection(retrieved[:k])
+            recall[k] += len(found) / len(expected)
+            hits[k] += bool(found)
+        rank = next((i for i, id_ in enumerate(retrieved) if id_ in expected), None)
+        reciprocal_ranks.append(0.0 if rank is None else 1 / (rank + 1))
+
+    n = len(labeled)
+    metrics = {f"recall@{k}": recall[k] / n for k in ks}
+    metrics.update({f"hit@{k}": hits[k] / n for k in ks})
+    metrics["mrr@10"] = sum(reciprocal_ranks) / n
+    metrics["search_p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+    metrics["search_p95_ms"] = float(np.percentile(latencies, 95) * 1000)
+    return metrics
+
+
+def embed_model(model_name: str, documents: List[str],
+                questions: List[str]) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """Document and question embeddings of a model, with its timings.
+    Embedding settings match `RAGInterface.embeddings`."""
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    start = time.perf_counter()
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cuda' if torch.cuda.is_available() else 'cpu'},
+        encode_kwargs={'normalize_embeddings': True})
+    loaded = time.perf_counter()
+    doc_vectors = np.asarray(embeddings.embed_documents(documents), dtype=np.float32)
+    embedded = time.perf_counter()
+
+    # Query latency as the bot sees it: one question at a time
+    query_vectors, latencies = [], []
+    for question in questions:
+        start_query = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(question))
+        latencies.append(time.perf_counter() - start_query)
+
+    timings = {
+        "model_load_s": loaded - start,
+        "embed_documents_s": embedded - loaded,
+        "embed_query_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "embed_query_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "native_dim": int(doc_vectors.shape[1]),
+    }
+    return doc_vectors, np.asarray(query_vectors, dtype=np.float32), timings
+
+
+def _as_list(value) -> List:
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [item for item in str(value).split(',') if item]
+
+
+def main(models: str = "intfloat/multilingual-e5-large",
+         dims: str = "",
+         ks: str = "1,3,5",
+         hnsw_m: str = "16",
+         hnsw_ef: str = "10,100",
+         questions_path: str = str(PATH_BENCHMARKS / "eval_questions.jsonl"),
+         auto_questions: bool = True,
+         min_exact_fast_path: float = 0.5,
+         pdf_rules_path: str = str(PATH_PROJECT / "data" / "official_rules_fsm.pdf"),
+         txt_comments_path: str = str(PATH_PROJECT / "data" / "fsm_comments.txt"),
+         output_path: str = "eval_results.json"):
+    """Evaluate every model x dimension x index combination.
+
+    Parameters
+    ----------
+    dims : str, optional
+        Comma-separated dimensions to truncate to, by default only the native one
+    hnsw_m, hnsw_ef : str, optional
+        Comma-separated HNSW `M` and search `ef` values, empty to skip HNSW
+    min_exact_fast_path : float, optional
+        Least share of known-item questions the lexical fast path must serve
+        without embedding, by default 0.5
+    """
+    ks = [int(k) for k in _as_list(ks)]
+    ids, documents, metadatas = load_fragments(pdf_rules_path, txt_comments_path)
+    sets = {"handwritten": load_labeled_set(questions_path, ids)}
+    if auto_questions:
+        sets["auto"] = auto_labeled_set(ids, documents)
+    logger.info("Fragments: %d, questions: %s", len(ids),
+                {name: len(labeled) for name, labeled in sets.items()})
+
+    results = []
+
+    def report(config: Dict[str, Any], index, queries_by_set) -> None:
+        for set_name, labeled in sets.items():
+            row = {**config, "questions": set_name, "index_mb": index.memory_mb()}
+            row.update(score(index, queries_by_set[set_name], labeled, ids, ks))
+            results.append(row)
+            logger.info("%s", row)
+
+    lexical = LexicalSearch(ids, documents, metadatas)
+    report({"model": "bm25", "dim": None, "index": "bm25"}, lexical,
+           {name: [q for q, _ in labeled] for name, labeled in sets.items()})
+    for row, labeled in zip(results, sets.values()):
+        row.update(lexical.fast_path(labeled, ids))
+        logger.info("Lexical fast path on %s questions: %.2f served, "
+                    "hit@1 %.2f", row["questions"], row["fast_path_share"],
+                    row["fast_path_hit@1"])
+    if "auto" in sets and results[-1]["fast_path_share"] < min_exact_fast_path:
+        raise SystemExit(
+            f"Lexical fast path served only {results[-1]['fast_path_share']:.2f} "
+            f"of known-item questions, expected at least {min_exact_fast_path}: "
+            f"check LEXICAL_FAST_PATH_CONFIDENCE and LEXICAL_FAST_PATH_MARGIN")
+
+    for model_name in _as_list(models):
+        questions = list(chain.from_iterable(
+            [q for q, _ in labeled] for labeled in sets.values()))
+        doc_vectors, query_vectors, timings = embed_model(
+            model_name, documents, questions)
+        model_dims = [int(d) for d in _as_list(dims)] or [timings["native_dim"]]
+
+        for dim in model_dims:
+            if dim > timings["native_dim"]:
+                logger.warning("%s has only %d dimensions, skipping %d",
+                               model_name, timings["native_dim"], dim)
+                continue
+            docs = truncate(doc_vectors, dim)
+            queries = truncate(query_vectors, dim)
+            queries_by_set, offset = {}, 0
+            for set_name, labeled in sets.items():
+                queries_by_set[set_name] = queries[offset:offset + len(labeled)]
+                offset += len(labeled)
+
+            base = {"model": model_name, "dim": dim, **timings}
+            report({**base, "index": "exact"}, ExactIndex(docs), queries_by_set)
+            for m in [int(v) for v in _as_list(hnsw_m)]:
+                for ef in [int(v) for v in _as_list(hnsw_ef)]:
+                    rss_before = rss_mb()
+                    start = time.perf_counter()
+                    index = HnswIndex(docs, m=m, ef=ef)
+                    config = {**base, "index": f"hnsw(M={m},ef={ef})",
+                              "build_s": time.perf_counter() - start,
+                              "rss_delta_mb": rss_mb() - rss_before}
+                    report(config, index, queries_by_set)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    k_report = 3 if 3 in ks else ks[-1]
+    print(f"\n{'model':<40} {'dim':>5} {'index':<18} {'set':<12} "
+          f"{'R@' + str(k_report):>6} {'MRR':>6} {'p50 ms':>8} {'emb ms':>8} {'MB':>7}")
+    for row in results:
+        print(f"{row['model'][-40:]:<40} {str(row['dim'] or '-'):>5} "
+              f"{row['index']:<18} {row['questions']:<12} "
+              f"{row[f'recall@{k_report}']:6.3f} {row['mrr@10']:6.3f} "
+              f"{row['search_p50_ms']:8.3f} "
+              f"{row.get('embed_query_p50_ms', 0.0):8.1f} {row['index_mb']:7.2f}")
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    import fire
+    fire.Fire(main)
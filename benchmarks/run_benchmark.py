@@ -0,0 +1,260 @@
+"""Offline end-to-end benchmark of the question pipeline.
+
+Replays a query corpus through the real `RAGInterface`, `LLMCaller` and
+`question_handler` with local stand-ins: a fake aiogram message, the
+in-process local vector index and a stub LLM server with configurable
+latency. Reports ingestion time, p50/p95/p99 latency, queries/sec per
+number of concurrent users and peak RSS, and writes them as JSON.
+
+Example:
+```
+python benchmarks/run_benchmark.py --concurrency=1,4,16 \
+--llm_latency_ms=800 --output_path=bench_results.json \
+--compare_with=bench_baseline.json
+```
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from itertools import chain
+from pathlib import Path
+
+PATH_PROJECT = Path(__file__).resolve().parents[1]
+PATH_BENCHMARKS = Path(__file__).resolve().parent
+
+
+def configure_environment(workdir: str, streaming: bool) -> None:
+    """Point every stateful setting to a scratch dir before `consts` is imported,
+    so the benchmark never touches real caches, indexes or the Chroma server."""
+    os.environ.update({
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_PATH": str(Path(workdir) / "local_index"),
+        "LEXICAL_INDEX_PATH": str(Path(workdir) / "lexical_index"),
+        "EMBEDDING_ARTIFACT_PATH": "",
+        "EMBEDDING_CACHE_PATH": "",
+        "INGEST_CHECKPOINT_PATH": "",
+        "LLM_STREAMING": str(streaming).lower(),
+        "STREAM_EDIT_INTERVAL_S": "0.5",
+    })
+    os.environ.setdefault("CHROMA_PORT", "8000")
+    os.environ.setdefault("EMBEDDING_MODEL_NAME", "intfloat/multilingual-e5-large")
+    os.environ.setdefault("EMBEDDING_DIMENSION", "1024")
+    os.environ.setdefault("DATA_RULES", str(PATH_PROJECT / "data" / "official_rules_fsm.pdf"))
+    os.environ.setdefault("DATA_COMMENTS", str(PATH_PROJECT / "data" / "fsm_comments.txt"))
+    sys.path.insert(0, str(PATH_PROJECT / "src"))
+    sys.path.insert(0, str(PATH_BENCHMARKS))
+
+
+class FakeMessage:
+    """Stand-in for `aiogram.types.Message` with the methods the handlers use."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.sent = []
+        self.first_reply_at = None
+
+    async def answer(self, text: str, **kwargs) -> "FakeMessage":
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+        reply = FakeMessage(text)
+        self.sent.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        self.text = text
+        return self
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024
+
+
+def ingest(rag, pdf_rules_path: str, txt_comments_path: str) -> dict:
+    from database.text_processor import load_txt_fragments, split_into_fragments
+
+    start = time.perf_counter()
+    fragments = list(chain(
+        split_into_fragments(data_path=pdf_rules_path),
+        load_txt_fragments(txt_comments_path, paragraph="Комментарий СК ФСМ")))
+    parsed = time.perf_counter()
+    rag.batch_add_rule_fragments(fragments)
+    done = time.perf_counter()
+    return {
+        "fragments": len(fragments),
+        "parse_seconds": parsed - start,
+        "embed_and_write_seconds": done - parsed,
+        "total_seconds": done - start,
+        "fragments_per_second": len(fragments) / (done - parsed),
+    }
+
+
+async def run_load(queries, concurrency: int, handler_kwargs: dict) -> dict:
+    """Replay `queries` with `concurrency` simulated users."""
+    from main import question_handler
+
+    queue = asyncio.Queue()
+    for query in queries:
+        queue.put_nowait(query)
+    latencies, first_replies, errors = [], [], 0
+
+    async def user():
+        nonlocal errors
+        while not queue.empty():
+            message = FakeMessage(queue.get_nowait())
+            start = time.perf_counter()
+            try:
+                await question_handler(message, **handler_kwargs)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if message.first_reply_at is not None:
+                first_replies.append(message.first_reply_at - start)
+
+    start = time.perf_counter()
+    # The handler prints the retrieved context, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "errors": errors,
+        "seconds": elapsed,
+        "queries_per_second": len(latencies) / elapsed,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "first_reply_p50": percentile(first_replies, 50),
+        "first_reply_p95": percentile(first_replies, 95),
+    }
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    """Print relative changes against a previous results file."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    baseline_runs = {run["concurrency"]: run for run in baseline["runs"]}
+    print(f"\nComparison with {baseline_path}:")
+    for run in results["runs"]:
+        old = baseline_runs.get(run["concurrency"])
+        if old is None:
+            continue
+        for key in ("queries_per_second", "latency_p50", "latency_p95", "latency_p99"):
+            change = (run[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"  users={run['concurrency']:<3} {key:<20} "
+                  f"{old[key]:10.4f} -> {run[key]:10.4f} ({change:+.1f}%)")
+
+
+async def benchmark(queries_path: str, concurrency: str, llm_latency_ms: float,
+                    llm_jitter_ms: float, repeats: int, answer_cache: bool,
+                    pdf_rules_path: str, txt_comments_path: str) -> dict:
+    from consts import MAX_CONCURRENT_REQUESTS, SEARCH_MODE
+    from database.fragments_db import RAGInterface
+    from llm.answer_cache import AnswerCache
+    from llm.llm_interface import LLMCaller
+    from llm.prompt import MAFIA_PROMPT, MAFIA_SYSTEM_PROMPT
+    from singleflight import SingleFlight
+    from stub_llm import STUB_MODEL_NAME, start_stub_llm
+
+    import litellm
+    litellm.register_model({f"openai/{STUB_MODEL_NAME}": {
+        "litellm_provider": "openai", "mode": "chat",
+        "input_cost_per_token": 0.0, "output_cost_per_token": 0.0,
+    }})
+
+    rag = RAGInterface()
+    ingestion = ingest(rag, pdf_rules_path, txt_comments_path)
+
+    runner, base_url = await start_stub_llm(
+        latency_ms=llm_latency_ms, jitter_ms=llm_jitter_ms)
+    llm = LLMCaller(model_name=f"openai/{STUB_MODEL_NAME}",
+                    llm_api_key="stub", llm_base_url=base_url,
+                    prompt=MAFIA_PROMPT, system_prompt=MAFIA_SYSTEM_PROMPT)
+
+    with open(queries_path, 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()] * repeats
+
+    runs = []
+    try:
+        for users in [int(n) for n in str(concurrency).split(',')]:
+            handler_kwargs = {
+                "rag": rag,
+                "llm": llm,
+                "answer_cache": AnswerCache(max_size=512 if answer_cache else 0),
+                "limiter": asyncio.Semaphore(MAX_CONCURRENT_REQUESTS),
+                "singleflight": SingleFlight(),
+            }
+            run = await run_load(queries, users, handler_kwargs)
+            runs.append(run)
+            print(f"users={users:<3} qps={run['queries_per_second']:7.2f} "
+                  f"p50={run['latency_p50']:.3f}s p95={run['latency_p95']:.3f}s "
+                  f"p99={run['latency_p99']:.3f}s errors={run['errors']}")
+    finally:
+        await runner.cleanup()
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "queries": len(queries),
+            "llm_latency_ms": llm_latency_ms,
+            "llm_jitter_ms": llm_jitter_ms,
+            "answer_cache": answer_cache,
+            "search_mode": SEARCH_MODE,
+            "max_concurrent_requests": MAX_CONCURRENT_REQUESTS,
+            "embedding_model": rag._embedding_model_name,
+            "python": platform.python_version(),
+        },
+        "ingestion": ingestion,
+        "runs": runs,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(queries_path: str = str(PATH_BENCHMARKS / "queries.txt"),
+         concurrency: str = "1,4,16",
+         llm_latency_ms: float = 500,
+         llm_jitter_ms: float = 100,
+         repeats: int = 1,
+         answer_cache: bool = False,
+         streaming: bool = False,
+         pdf_rules_path: str = str(PATH_PROJECT / "data" / "official_rules_fsm.pdf"),
+         txt_comments_path: str = str(PATH_PROJECT / "data" / "fsm_comments.txt"),
+         output_path: str = "bench_results.json",
+         compare_with: str | None = None):
+    with tempfile.TemporaryDirectory(prefix="mafia_bench_") as workdir:
+        configure_environment(workdir, streaming)
+        results = asyncio.run(benchmark(
+            queries_path, concurrency, llm_latency_ms, llm_jitter_ms,
+            repeats, answer_cache, pdf_rules_path, txt_comments_path))
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Ingestion: {results['ingestion']['total_seconds']:.1f}s "
+          f"({results['ingestion']['fragments']} fragments), "
+          f"peak RSS: {results['peak_rss_mb']:.0f} MB")
+    print(f"Results written to {output_path}")
+    if compare_with:
+        compare(results, compare_with)
+
+
+if __name__ == "__main__":
+    import fire
+    fire.Fire(main)
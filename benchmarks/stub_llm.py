@@ -0,0 +1,99 @@
+"""OpenAI-compatible stub LLM server with configurable latency.
+
+Serves `POST /v1/chat/completions` (plain and streaming), so `LLMCaller`
+can be benchmarked through litellm without a paid provider. Example:
+```
+python benchmarks/stub_llm.py --port=8089 --latency_ms=800
+```
+"""
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+STUB_MODEL_NAME = "stub-model"
+STUB_ANSWER = ("Согласно правилам ФСМ, судья действует в соответствии "
+               "с приведёнными фрагментами правил. ") * 4
+
+
+def create_app(latency_ms: float = 500, jitter_ms: float = 100,
+               tokens_per_second: float = 200) -> web.Application:
+    """Stub app: waits `latency_ms` ± `jitter_ms` before the first token,
+    then streams words at `tokens_per_second`."""
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt_tokens = sum(len(m["content"].split()) for m in body["messages"])
+        words = STUB_ANSWER.split(" ")
+        created = int(time.time())
+        await asyncio.sleep(
+            max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(words) / tokens_per_second)
+            return web.json_response({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": STUB_MODEL_NAME,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": STUB_ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(words),
+                    "total_tokens": prompt_tokens + len(words),
+                },
+            })
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": STUB_MODEL_NAME,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word + " "},
+                    "finish_reason": "stop" if i == len(words) - 1 else None,
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(1 / tokens_per_second)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start_stub_llm(host: str = "127.0.0.1", port: int = 0,
+                         **app_kwargs) -> tuple:
+    """Start the stub in the running event loop.
+    Returns the aiohttp runner and the base url to pass to `LLMCaller`."""
+    runner = web.AppRunner(create_app(**app_kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}/v1"
+
+
+def serve(host: str = "127.0.0.1", port: int = 8089, latency_ms: float = 500,
+          jitter_ms: float = 100, tokens_per_second: float = 200):
+    web.run_app(create_app(latency_ms, jitter_ms, tokens_per_second),
+                host=host, port=port)
+
+
+if __name__ == "__main__":
+    import fire
+    fire.Fire(serve)
@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -25,6 +26,101 @@ CHROMA_SERVER_AUTHN_CREDENTIALS_FILE = os.environ.get(
     default=env_values.get('CHROMA_SERVER_AUTHN_CREDENTIALS_FILE'))
 CHROMA_USER = os.environ.get(
     'CHROMA_USER', default=env_values.get('CHROMA_USER'))
+# Bot searches go through a pooled async client: per-request deadline,
+# HTTP connection limit, and how long to fail fast before reconnecting
+# after Chroma became unreachable
+CHROMA_ASYNC = os.environ.get(
+    'CHROMA_ASYNC',
+    default=env_values.get('CHROMA_ASYNC', 'true')).lower() == 'true'
+CHROMA_TIMEOUT_S = float(
+    os.environ.get('CHROMA_TIMEOUT_S',
+                   default=env_values.get('CHROMA_TIMEOUT_S', 5))
+)
+CHROMA_MAX_CONNECTIONS = int(
+    os.environ.get('CHROMA_MAX_CONNECTIONS',
+                   default=env_values.get('CHROMA_MAX_CONNECTIONS', 20))
+)
+CHROMA_RECONNECT_INTERVAL_S = float(
+    os.environ.get('CHROMA_RECONNECT_INTERVAL_S',
+                   default=env_values.get('CHROMA_RECONNECT_INTERVAL_S', 5))
+)
+# Concurrent vector searches merged into one Chroma query
+VECTOR_BATCH_MAX_SIZE = int(
+    os.environ.get('VECTOR_BATCH_MAX_SIZE',
+                   default=env_values.get('VECTOR_BATCH_MAX_SIZE', 32))
+)
+VECTOR_BATCH_WAIT_MS = float(
+    os.environ.get('VECTOR_BATCH_WAIT_MS',
+                   default=env_values.get('VECTOR_BATCH_WAIT_MS', 2))
+)
+
+# Vector backend: "chroma" (HTTP server) or "local" (in-process memmap index)
+VECTOR_BACKEND = os.environ.get(
+    'VECTOR_BACKEND', default=env_values.get('VECTOR_BACKEND', 'chroma'))
+LOCAL_INDEX_PATH = os.environ.get(
+    'LOCAL_INDEX_PATH',
+    default=env_values.get('LOCAL_INDEX_PATH',
+                           str(path_project/'data'/'local_index')))
+
+# How often (s) the bot re-reads the rules collection version
+RULES_VERSION_CHECK_S = float(
+    os.environ.get('RULES_VERSION_CHECK_S',
+                   default=env_values.get('RULES_VERSION_CHECK_S', 30))
+)
+
+# Retrieval mode: "dense", "lexical" (BM25) or "hybrid";
+# in hybrid mode a top lexical hit with confidence above the threshold
+# that leads the next hit by the margin (share of its confidence)
+# skips embedding, otherwise both rankings of HYBRID_CANDIDATES are fused.
+# Defaults are calibrated with benchmarks/eval_retrieval.py
+SEARCH_MODE = os.environ.get(
+    'SEARCH_MODE', default=env_values.get('SEARCH_MODE', 'dense'))
+LEXICAL_FAST_PATH_CONFIDENCE = float(
+    os.environ.get('LEXICAL_FAST_PATH_CONFIDENCE',
+                   default=env_values.get('LEXICAL_FAST_PATH_CONFIDENCE', 0.8))
+)
+LEXICAL_FAST_PATH_MARGIN = float(
+    os.environ.get('LEXICAL_FAST_PATH_MARGIN',
+                   default=env_values.get('LEXICAL_FAST_PATH_MARGIN', 0.2))
+)
+HYBRID_CANDIDATES = int(
+    os.environ.get('HYBRID_CANDIDATES',
+                   default=env_values.get('HYBRID_CANDIDATES', 10))
+)
+LEXICAL_INDEX_PATH = os.environ.get(
+    'LEXICAL_INDEX_PATH',
+    default=env_values.get('LEXICAL_INDEX_PATH',
+                           str(path_project/'data'/'lexical_index')))
+
+# Ingestion: fragments embedded and written per chunk,
+# and the checkpoint file used to resume an interrupted run
+INGEST_CHUNK_SIZE = int(
+    os.environ.get('INGEST_CHUNK_SIZE',
+                   default=env_values.get('INGEST_CHUNK_SIZE', 64))
+)
+INGEST_CHECKPOINT_PATH = os.environ.get(
+    'INGEST_CHECKPOINT_PATH',
+    default=env_values.get('INGEST_CHECKPOINT_PATH',
+                           str(path_project/'data'/'ingest_checkpoint.json')))
+
+# Documents to ingest: a JSON manifest or a directory of PDF and txt files,
+# empty for DATA_RULES and DATA_COMMENTS only (see database/document_sources.py)
+INGEST_SOURCES = os.environ.get(
+    'INGEST_SOURCES', default=env_values.get('INGEST_SOURCES')) or None
+# Processes extracting PDF pages, and pages extracted by one task
+INGEST_WORKERS = int(
+    os.environ.get('INGEST_WORKERS',
+                   default=env_values.get('INGEST_WORKERS', os.cpu_count() or 1))
+)
+INGEST_PAGES_PER_TASK = int(
+    os.environ.get('INGEST_PAGES_PER_TASK',
+                   default=env_values.get('INGEST_PAGES_PER_TASK', 8))
+)
+# Parsed fragments of each document, keyed by file hash
+FRAGMENT_CACHE_PATH = os.environ.get(
+    'FRAGMENT_CACHE_PATH',
+    default=env_values.get('FRAGMENT_CACHE_PATH',
+                           str(path_project/'data'/'fragment_cache')))
 
 # Telegram bot
 TELEGRAM_BOT_TOKEN = os.environ.get(
@@ -32,6 +128,36 @@ TELEGRAM_BOT_TOKEN = os.environ.get(
     default=env_values.get('TELEGRAM_BOT_TOKEN')
 )
 
+# "polling" (default, for development) or "webhook": an HTTP server
+# on WEBHOOK_HOST:WEBHOOK_PORT receives updates at WEBHOOK_BASE_URL + WEBHOOK_PATH
+# and puts them into a queue of WEBHOOK_QUEUE_SIZE served by WEBHOOK_WORKERS tasks
+BOT_MODE = os.environ.get(
+    'BOT_MODE', default=env_values.get('BOT_MODE', 'polling'))
+WEBHOOK_BASE_URL = os.environ.get(
+    'WEBHOOK_BASE_URL', default=env_values.get('WEBHOOK_BASE_URL'))
+WEBHOOK_PATH = os.environ.get(
+    'WEBHOOK_PATH', default=env_values.get('WEBHOOK_PATH', '/telegram/webhook'))
+WEBHOOK_SECRET = os.environ.get(
+    'WEBHOOK_SECRET', default=env_values.get('WEBHOOK_SECRET')) or None
+WEBHOOK_HOST = os.environ.get(
+    'WEBHOOK_HOST', default=env_values.get('WEBHOOK_HOST', '0.0.0.0'))
+WEBHOOK_PORT = int(
+    os.environ.get('WEBHOOK_PORT',
+                   default=env_values.get('WEBHOOK_PORT', 8081))
+)
+WEBHOOK_WORKERS = int(
+    os.environ.get('WEBHOOK_WORKERS',
+                   default=env_values.get('WEBHOOK_WORKERS', 16))
+)
+WEBHOOK_QUEUE_SIZE = int(
+    os.environ.get('WEBHOOK_QUEUE_SIZE',
+                   default=env_values.get('WEBHOOK_QUEUE_SIZE', 256))
+)
+WEBHOOK_DRAIN_TIMEOUT_S = float(
+    os.environ.get('WEBHOOK_DRAIN_TIMEOUT_S',
+                   default=env_values.get('WEBHOOK_DRAIN_TIMEOUT_S', 30))
+)
+
 # RAG vectorizer
 EMBEDDING_MODEL_NAME = os.environ.get(
     'EMBEDDING_MODEL_NAME',
@@ -41,6 +167,64 @@ EMBEDDING_DIMENSION = int(
                    default=env_values.get('EMBEDDING_DIMENSION'))
 )
 
+# Embedding backend: "huggingface" (PyTorch), "onnx" (ONNX Runtime on CPU,
+# int8-quantized for EMBEDDING_ONNX_QUANTIZATION: "avx2", "avx512",
+# "avx512_vnni" or "arm64"; empty for an unquantized ONNX export)
+# or "remote" (shared embedding server, see below)
+EMBEDDING_BACKEND = os.environ.get(
+    'EMBEDDING_BACKEND',
+    default=env_values.get('EMBEDDING_BACKEND', 'huggingface'))
+EMBEDDING_ONNX_QUANTIZATION = os.environ.get(
+    'EMBEDDING_ONNX_QUANTIZATION',
+    default=env_values.get('EMBEDDING_ONNX_QUANTIZATION', 'avx2'))
+EMBEDDING_ONNX_PATH = os.environ.get(
+    'EMBEDDING_ONNX_PATH',
+    default=env_values.get('EMBEDDING_ONNX_PATH',
+                           str(path_project/'data'/'onnx_models')))
+# Shared embedding server (src/embedding_server.py) used by the "remote"
+# backend; EMBEDDING_SERVER_BACKEND is the backend the server itself runs.
+# With EMBEDDING_SERVER_SOCKET set, both sides use that Unix socket instead of TCP
+EMBEDDING_SERVER_URL = os.environ.get(
+    'EMBEDDING_SERVER_URL',
+    default=env_values.get('EMBEDDING_SERVER_URL', 'http://localhost:8080'))
+EMBEDDING_SERVER_SOCKET = os.environ.get(
+    'EMBEDDING_SERVER_SOCKET',
+    default=env_values.get('EMBEDDING_SERVER_SOCKET', '')) or None
+EMBEDDING_SERVER_HOST = os.environ.get(
+    'EMBEDDING_SERVER_HOST',
+    default=env_values.get('EMBEDDING_SERVER_HOST', '0.0.0.0'))
+EMBEDDING_SERVER_PORT = int(
+    os.environ.get('EMBEDDING_SERVER_PORT',
+                   default=env_values.get('EMBEDDING_SERVER_PORT', 8080))
+)
+EMBEDDING_SERVER_BACKEND = os.environ.get(
+    'EMBEDDING_SERVER_BACKEND',
+    default=env_values.get('EMBEDDING_SERVER_BACKEND', 'huggingface'))
+# Minimal cosine similarity between stored and re-computed fragment vectors
+# for the current backend to be considered compatible with the collection
+EMBEDDING_COMPAT_MIN_SIMILARITY = float(
+    os.environ.get('EMBEDDING_COMPAT_MIN_SIMILARITY',
+                   default=env_values.get('EMBEDDING_COMPAT_MIN_SIMILARITY', 0.98))
+)
+
+# Precomputed embeddings artifact (see src/database/build_artifact.py),
+# used to fill an empty local index without running the model
+EMBEDDING_ARTIFACT_PATH = os.environ.get(
+    'EMBEDDING_ARTIFACT_PATH',
+    default=env_values.get('EMBEDDING_ARTIFACT_PATH',
+                           str(path_project/'data'/'embedding_artifact')))
+
+# Query embedding cache: in-memory LRU size and SQLite file
+# (empty path keeps the cache in memory only)
+EMBEDDING_CACHE_SIZE = int(
+    os.environ.get('EMBEDDING_CACHE_SIZE',
+                   default=env_values.get('EMBEDDING_CACHE_SIZE', 1024))
+)
+EMBEDDING_CACHE_PATH = os.environ.get(
+    'EMBEDDING_CACHE_PATH',
+    default=env_values.get('EMBEDDING_CACHE_PATH',
+                           str(path_project/'data'/'embedding_cache.sqlite')))
+
 # LLM constants for processing text
 LLM_API_KEY = os.environ.get(
     'LLM_API_KEY', default=env_values.get('LLM_API_KEY'))
@@ -51,8 +235,135 @@ if LLM_BASE_URL == "":
 LLM_MODEL_NAME = os.environ.get(
     'LLM_MODEL_NAME', default=env_values.get('LLM_MODEL_NAME'))
 
+# LLM call policy: per-attempt timeout, overall deadline of a question,
+# retries with jittered exponential backoff per model, then the fallbacks.
+# LLM_FALLBACKS is a JSON list tried in order after the main model, e.g.
+# [{"model": "ollama/qwen2.5:7b", "base_url": "http://ollama:11434"}]
+LLM_TIMEOUT_S = float(
+    os.environ.get('LLM_TIMEOUT_S',
+                   default=env_values.get('LLM_TIMEOUT_S', 30))
+)
+LLM_DEADLINE_S = float(
+    os.environ.get('LLM_DEADLINE_S',
+                   default=env_values.get('LLM_DEADLINE_S', 60))
+)
+LLM_MAX_RETRIES = int(
+    os.environ.get('LLM_MAX_RETRIES',
+                   default=env_values.get('LLM_MAX_RETRIES', 2))
+)
+LLM_BACKOFF_BASE_S = float(
+    os.environ.get('LLM_BACKOFF_BASE_S',
+                   default=env_values.get('LLM_BACKOFF_BASE_S', 0.5))
+)
+LLM_BACKOFF_MAX_S = float(
+    os.environ.get('LLM_BACKOFF_MAX_S',
+                   default=env_values.get('LLM_BACKOFF_MAX_S', 4))
+)
+LLM_FALLBACKS = json.loads(
+    os.environ.get('LLM_FALLBACKS',
+                   default=env_values.get('LLM_FALLBACKS')) or '[]')
+# Hedging: if a call is slower than the LLM_HEDGE_QUANTILE of recent latencies
+# of its model, a second identical request is sent and the first answer wins
+LLM_HEDGING = os.environ.get(
+    'LLM_HEDGING',
+    default=env_values.get('LLM_HEDGING', 'false')).lower() == 'true'
+LLM_HEDGE_QUANTILE = float(
+    os.environ.get('LLM_HEDGE_QUANTILE',
+                   default=env_values.get('LLM_HEDGE_QUANTILE', 0.95))
+)
+LLM_HEDGE_MIN_SAMPLES = int(
+    os.environ.get('LLM_HEDGE_MIN_SAMPLES',
+                   default=env_values.get('LLM_HEDGE_MIN_SAMPLES', 20))
+)
+# Keep-alive connections shared by all LLM calls
+LLM_MAX_CONNECTIONS = int(
+    os.environ.get('LLM_MAX_CONNECTIONS',
+                   default=env_values.get('LLM_MAX_CONNECTIONS', 20))
+)
+
+# LLM context: retrieved candidates packed into at most CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_CANDIDATES = int(
+    os.environ.get('CONTEXT_CANDIDATES',
+                   default=env_values.get('CONTEXT_CANDIDATES', 5))
+)
+CONTEXT_TOKEN_BUDGET = int(
+    os.environ.get('CONTEXT_TOKEN_BUDGET',
+                   default=env_values.get('CONTEXT_TOKEN_BUDGET', 1000))
+)
+
+# Stream LLM answers into Telegram by editing the reply,
+# at most one edit per STREAM_EDIT_INTERVAL_S seconds
+LLM_STREAMING = os.environ.get(
+    'LLM_STREAMING',
+    default=env_values.get('LLM_STREAMING', 'true')).lower() == 'true'
+STREAM_EDIT_INTERVAL_S = float(
+    os.environ.get('STREAM_EDIT_INTERVAL_S',
+                   default=env_values.get('STREAM_EDIT_INTERVAL_S', 1.0))
+)
+
+# Semantic LLM answer cache (ANSWER_CACHE_SIZE=0 disables it)
+ANSWER_CACHE_SIZE = int(
+    os.environ.get('ANSWER_CACHE_SIZE',
+                   default=env_values.get('ANSWER_CACHE_SIZE', 512))
+)
+ANSWER_CACHE_SIMILARITY = float(
+    os.environ.get('ANSWER_CACHE_SIMILARITY',
+                   default=env_values.get('ANSWER_CACHE_SIMILARITY', 0.95))
+)
+ANSWER_CACHE_TTL_S = float(
+    os.environ.get('ANSWER_CACHE_TTL_S',
+                   default=env_values.get('ANSWER_CACHE_TTL_S', 24 * 60 * 60))
+)
+
 # Path to data files
 DATA_COMMENTS = os.environ.get(
     'DATA_COMMENTS', default=env_values.get('DATA_COMMENTS'))
 DATA_RULES = os.environ.get(
     'DATA_RULES', default=env_values.get('DATA_RULES'))
+
+# Bot concurrency
+MAX_CONCURRENT_REQUESTS = int(
+    os.environ.get('MAX_CONCURRENT_REQUESTS',
+                   default=env_values.get('MAX_CONCURRENT_REQUESTS', 8))
+)
+RAG_EXECUTOR_WORKERS = int(
+    os.environ.get('RAG_EXECUTOR_WORKERS',
+                   default=env_values.get('RAG_EXECUTOR_WORKERS', 4))
+)
+
+# Query embedding micro-batching: max queries per batch
+# and how long (ms) the first query may wait for others to join
+EMBEDDING_BATCH_MAX_SIZE = int(
+    os.environ.get('EMBEDDING_BATCH_MAX_SIZE',
+                   default=env_values.get('EMBEDDING_BATCH_MAX_SIZE', 16))
+)
+EMBEDDING_BATCH_WAIT_MS = float(
+    os.environ.get('EMBEDDING_BATCH_WAIT_MS',
+                   default=env_values.get('EMBEDDING_BATCH_WAIT_MS', 10))
+)
+
+# Metrics: per-stage latency histograms etc. served on METRICS_PORT/metrics
+METRICS_ENABLED = os.environ.get(
+    'METRICS_ENABLED',
+    default=env_values.get('METRICS_ENABLED', 'false')).lower() == 'true'
+METRICS_HOST = os.environ.get(
+    'METRICS_HOST', default=env_values.get('METRICS_HOST', '0.0.0.0'))
+METRICS_PORT = int(
+    os.environ.get('METRICS_PORT',
+                   default=env_values.get('METRICS_PORT', 9100))
+)
+
+# Startup: warm-up of the models before the bot takes questions,
+# and the health/readiness endpoint (HEALTH_PORT/health, HEALTH_PORT/ready)
+WARMUP_ENABLED = os.environ.get(
+    'WARMUP_ENABLED',
+    default=env_values.get('WARMUP_ENABLED', 'true')).lower() == 'true'
+HEALTH_ENABLED = os.environ.get(
+    'HEALTH_ENABLED',
+    default=env_values.get('HEALTH_ENABLED', 'true')).lower() == 'true'
+HEALTH_HOST = os.environ.get(
+    'HEALTH_HOST', default=env_values.get('HEALTH_HOST', '0.0.0.0'))
+HEALTH_PORT = int(
+    os.environ.get('HEALTH_PORT',
+                   default=env_values.get('HEALTH_PORT', 8090))
+)
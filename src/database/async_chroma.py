@@ -0,0 +1,156 @@
+"""Async access to the Chroma rules collection for the bot's searches."""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import chromadb
+import httpx
+from chromadb.config import Settings
+
+from consts import (CHROMA_RECONNECT_INTERVAL_S, CHROMA_TIMEOUT_S,
+                    VECTOR_BATCH_MAX_SIZE, VECTOR_BATCH_WAIT_MS)
+
+logger = logging.getLogger(__name__)
+
+QueryResult = Dict[str, List[List[Any]]]
+# Result fields in the order they are requested
+INCLUDE_FIELDS = ("documents", "metadatas", "distances")
+
+
+class AsyncChromaCollection:
+    """Queries of the rules collection over a pooled async HTTP client.
+
+    Every request has a deadline of `timeout` seconds. A timed out or
+    failed connection drops the client and the request is retried once on
+    a new one; if Chroma is unreachable, requests fail fast for
+    `reconnect_interval` seconds instead of each waiting for its deadline,
+    then a heartbeat decides whether to reconnect.
+    """
+
+    def __init__(self, host: str, port: int, settings: Settings,
+                 collection_name: str = "rule_fragments",
+                 timeout: float = CHROMA_TIMEOUT_S,
+                 reconnect_interval: float = CHROMA_RECONNECT_INTERVAL_S):
+        self._host = host
+        self._port = port
+        self._settings = settings
+        self._collection_name = collection_name
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self._collection = None
+        self._lock = asyncio.Lock()
+        self._down_until = float('-inf')
+
+    async def _connect(self):
+        async with self._lock:
+            if self._collection is not None:
+                return self._collection
+            if time.monotonic() < self._down_until:
+                raise ConnectionError("Chroma is unavailable, reconnecting later")
+            try:
+                client = await asyncio.wait_for(chromadb.AsyncHttpClient(
+                    host=self._host, port=self._port,
+                    settings=self._settings), self.timeout)
+                await asyncio.wait_for(client.heartbeat(), self.timeout)
+                self._collection = await asyncio.wait_for(
+                    client.get_collection(self._collection_name), self.timeout)
+            except (asyncio.TimeoutError, httpx.TransportError) as e:
+                self._down_until = time.monotonic() + self.reconnect_interval
+                logger.error("Failed to connect to Chroma: %r", e)
+                raise ConnectionError("Chroma is unavailable") from e
+            logger.info("Connected async Chroma client to %s:%s",
+                        self._host, self._port)
+            return self._collection
+
+    def _disconnect(self, collection) -> None:
+        if self._collection is collection:
+            self._collection = None
+
+    async def query(self, query_embeddings: List[List[float]],
+                    n_results: int,
+                    include: Tuple[str, ...] = INCLUDE_FIELDS) -> QueryResult:
+        """Nearest fragments of each query embedding, in one request.
+        Ids are always returned, other fields only if listed in `include`."""
+        for attempt in range(2):
+            collection = await self._connect()
+            try:
+                return await asyncio.wait_for(collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=n_results,
+                    include=list(include)),
+                    self.timeout)
+            except (asyncio.TimeoutError, httpx.TransportError) as e:
+                # The connection may be stale (e.g. Chroma restarted)
+                self._disconnect(collection)
+                logger.warning("Chroma query failed (attempt %d): %r",
+                               attempt + 1, e)
+                if attempt:
+                    raise
+
+
+class VectorQueryBatcher:
+    """Collect concurrent vector searches into one multi-query request.
+
+    Works like `QueryEmbeddingBatcher`: the first search of a batch waits
+    at most `max_wait_ms` for others, then one query asks for the largest
+    `k` and every field any search of the batch needs, and every caller
+    gets its own top `k`.
+    """
+
+    def __init__(
+        self,
+        query_batch: Callable[[List[List[float]], int, Tuple[str, ...]],
+                              Awaitable[QueryResult]],
+        max_batch_size: int = VECTOR_BATCH_MAX_SIZE,
+        max_wait_ms: float = VECTOR_BATCH_WAIT_MS
+    ):
+        self._query_batch = query_batch
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: List[
+            Tuple[List[float], int, Tuple[str, ...], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def query(self, embedding: List[float], k: int,
+                    include: Tuple[str, ...] = INCLUDE_FIELDS) -> QueryResult:
+        """Single-query result of one embedding."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((embedding, k, tuple(include), future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[
+            Tuple[List[float], int, Tuple[str, ...], asyncio.Future]]) -> None:
+        needed = {field for _, _, include, _ in batch for field in include}
+        include = tuple(field for field in INCLUDE_FIELDS if field in needed)
+        try:
+            results = await self._query_batch(
+                [embedding for embedding, _, _, _ in batch],
+                max(k for _, k, _, _ in batch),
+                include)
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        logger.debug("Queried batch of %d vectors", len(batch))
+        for row, (_, k, _, future) in enumerate(batch):
+            if not future.done():
+                future.set_result({key: [results[key][row][:k]]
+                                   for key in ("ids",) + include})
@@ -0,0 +1,47 @@
+"""Build the precomputed embedding artifact for instant cold starts."""
+import logging
+
+import fire
+from document_sources import (default_sources, discover_sources,
+                              load_fragments)
+from fragments_db import RAGInterface
+
+from consts import (DATA_COMMENTS, DATA_RULES, EMBEDDING_ARTIFACT_PATH,
+                    INGEST_SOURCES)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def build_embedding_artifact(
+        pdf_rules_path: str = DATA_RULES,
+        txt_comments_path: str = DATA_COMMENTS,
+        output_path: str = EMBEDDING_ARTIFACT_PATH,
+        sources: str | None = INGEST_SOURCES):
+    # Only the embedding model is used: the local backend is never written to
+    rag = RAGInterface(backend="local", local_index_path=output_path,
+                       artifact_path=None)
+
+    documents = (discover_sources(sources) if sources
+                 else default_sources(pdf_rules_path, txt_comments_path))
+    all_fragments = load_fragments(documents)
+    logger.info("Total fragments to embed: %s", len(all_fragments))
+
+    artifact = rag.build_artifact(all_fragments)
+    artifact.save(output_path)
+    logger.info("Artifact building completed.")
+
+
+if __name__ == "__main__":
+    """Example usage:
+    ```
+    python build_artifact.py \
+    --pdf_rules_path=data/official_rules_fsm.pdf \
+    --txt_comments_path=data/fsm_comments.txt \
+    --output_path=data/embedding_artifact
+    ```
+    """
+    logger.info("Entering script...")
+    fire.Fire(build_embedding_artifact)
@@ -0,0 +1,218 @@
+"""Multi-document ingestion: sources, parallel parsing and the parsed-fragment cache.
+
+Sources are PDF rule documents and txt comment files (see text_processor),
+listed in a JSON manifest or found in a directory:
+```
+[
+    {"path": "official_rules_fsm.pdf"},
+    {"path": "regional_rules.pdf", "prefix": "ЮФО "},
+    {"path": "fsm_comments.txt", "paragraph": "Комментарий СК ФСМ"}
+]
+```
+Relative paths are resolved against the manifest directory.
+`prefix` is prepended to paragraph numbers of a PDF, so paragraphs of
+several documents don't collide, and ends with a space, so the number is
+found after it: "ЮФО " -> "ЮФО 4.3"; `paragraph` labels the comments of a txt
+file. In a directory every PDF is prefixed with its file name and every txt
+file is labeled with it, unless the directory contains `manifest.json`.
+
+Pages of all PDFs are extracted in parallel by a process pool, then each
+document is split into fragments. Parsed fragments are cached on disk by
+file hash, so unchanged documents are not parsed again.
+"""
+import hashlib
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from consts import (DATA_COMMENTS, DATA_RULES, FRAGMENT_CACHE_PATH,
+                    INGEST_PAGES_PER_TASK, INGEST_WORKERS)
+from database.rule_fragment import RuleFragment
+from database.text_processor import (count_pdf_pages, extract_page_texts,
+                                     iter_page_lines, load_txt_fragments,
+                                     split_lines_into_fragments)
+
+logger = logging.getLogger(__name__)
+
+# Bump when parsing changes, so cached fragments are parsed again
+PARSER_VERSION = 3
+MANIFEST_NAME = "manifest.json"
+SOURCE_SUFFIXES = (".pdf", ".txt")
+
+
+@dataclass(frozen=True)
+class DocumentSource:
+    path: str
+    prefix: str = ""  # PDF: paragraph number prefix
+    paragraph: Optional[str] = None  # txt: comment label, file name by default
+
+    @property
+    def kind(self) -> str:
+        return Path(self.path).suffix.lower().lstrip('.')
+
+    def label(self) -> str:
+        return self.paragraph or Path(self.path).stem
+
+
+def default_sources(pdf_rules_path: str = DATA_RULES,
+                    txt_comments_path: str = DATA_COMMENTS
+                    ) -> List[DocumentSource]:
+    """The FSM rules and their comments."""
+    return [DocumentSource(pdf_rules_path),
+            DocumentSource(txt_comments_path, paragraph="Комментарий СК ФСМ")]
+
+
+def discover_sources(path: str) -> List[DocumentSource]:
+    """Sources listed in a manifest file, or found in a directory."""
+    root = Path(path)
+    if root.is_dir() and not (root / MANIFEST_NAME).exists():
+        sources = [DocumentSource(str(file), prefix=f"{file.stem} ")
+                   if file.suffix.lower() == ".pdf"
+                   else DocumentSource(str(file))
+                   for file in sorted(root.iterdir())
+                   if file.suffix.lower() in SOURCE_SUFFIXES]
+    else:
+        manifest = root / MANIFEST_NAME if root.is_dir() else root
+        with open(manifest, encoding='utf-8') as f:
+            entries = json.load(f)
+        sources = [DocumentSource(
+            path=str(manifest.parent / entry["path"]),
+            prefix=entry.get("prefix", ""),
+            paragraph=entry.get("paragraph"))
+            for entry in entries]
+
+    for source in sources:
+        if source.kind not in ("pdf", "txt"):
+            raise ValueError(f"Unsupported document type: {source.path}")
+        if source.prefix and not source.prefix[-1].isspace():
+            raise ValueError(
+                f"Prefix {source.prefix!r} of {source.path} must end with a space")
+    if not sources:
+        raise ValueError(f"No documents found in {path}")
+    logger.info("Found %d documents in %s", len(sources), path)
+    return sources
+
+
+class FragmentCache:
+    """Parsed fragments of each document, stored as JSON files named by
+    the hash of the document and its parsing options."""
+
+    def __init__(self, path: str = FRAGMENT_CACHE_PATH):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(source: DocumentSource) -> str:
+        digest = hashlib.sha256()
+        with open(source.path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(json.dumps(
+            [PARSER_VERSION, source.kind, source.prefix, source.label()],
+            ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[RuleFragment]]:
+        file = self.path / f"{key}.json"
+        if not file.exists():
+            return None
+        with open(file, encoding='utf-8') as f:
+            return [RuleFragment.model_validate(item) for item in json.load(f)]
+
+    def put(self, key: str, fragments: List[RuleFragment]) -> None:
+        file = self.path / f"{key}.json"
+        tmp = file.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump([fragment.model_dump(exclude={"embedding"})
+                       for fragment in fragments], f, ensure_ascii=False)
+        tmp.replace(file)
+
+
+def _extract_pdfs(paths: List[str], workers: int,
+                  pages_per_task: int) -> Dict[str, List[str]]:
+    """Page texts of PDF files, extracted in page ranges by a process pool."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = []
+        for path in paths:
+            pages = count_pdf_pages(path)
+            for start in range(0, pages, pages_per_task):
+                stop = min(start + pages_per_task, pages)
+                tasks.append(
+                    (path, pool.submit(extract_page_texts, path, start, stop)))
+        page_texts: Dict[str, List[str]] = {path: [] for path in paths}
+        # Ranges of a file are submitted in order
+        for path, future in tasks:
+            page_texts[path] += future.result()
+    return page_texts
+
+
+def load_fragments(sources: List[DocumentSource],
+                   cache_path: Optional[str] = FRAGMENT_CACHE_PATH,
+                   workers: int = INGEST_WORKERS,
+                   pages_per_task: int = INGEST_PAGES_PER_TASK
+                   ) -> List[RuleFragment]:
+    """Fragments of all sources, in the order of the sources.
+
+    Parameters
+    ----------
+    sources : list[DocumentSource]
+        Documents to parse
+    cache_path : str, optional
+        Directory of the parsed-fragment cache, None disables it,
+        by default FRAGMENT_CACHE_PATH
+    workers : int, optional
+        Processes extracting PDF pages, by default INGEST_WORKERS
+    pages_per_task : int, optional
+        Pages extracted by one task, by default INGEST_PAGES_PER_TASK
+
+    Returns
+    -------
+    list[RuleFragment]
+        Parsed fragments
+
+    Raises
+    ------
+    ValueError
+        If paragraphs of different documents share a number
+    """
+    cache = FragmentCache(cache_path) if cache_path else None
+    keys = {source: cache.key(source) for source in sources} if cache else {}
+    parsed: Dict[DocumentSource, List[RuleFragment]] = {}
+    for source in sources:
+        cached = cache.get(keys[source]) if cache else None
+        if cached is not None:
+            logger.info("Using cached fragments of %s", source.path)
+            parsed[source] = cached
+    cached_sources = set(parsed)
+
+    pending_pdfs = [source for source in sources
+                    if source.kind == "pdf" and source not in parsed]
+    if pending_pdfs:
+        page_texts = _extract_pdfs(
+            sorted({source.path for source in pending_pdfs}),
+            workers, pages_per_task)
+        for source in pending_pdfs:
+            parsed[source] = list(split_lines_into_fragments(
+                iter_page_lines(page_texts[source.path]), prefix=source.prefix))
+    for source in sources:
+        if source.kind == "txt" and source not in parsed:
+            parsed[source] = load_txt_fragments(
+                source.path, paragraph=source.label())
+
+    fragments: List[RuleFragment] = []
+    owners: Dict[str, str] = {}
+    for source in sources:
+        logger.info("%s: %d fragments", source.path, len(parsed[source]))
+        if cache and source not in cached_sources:
+            cache.put(keys[source], parsed[source])
+        for fragment in parsed[source]:
+            owner = owners.setdefault(fragment.paragraph, source.path)
+            if owner != source.path:
+                raise ValueError(
+                    f"Paragraph {fragment.paragraph} is in both {owner} and "
+                    f"{source.path}, set a distinct prefix for one of them")
+        fragments += parsed[source]
+    return fragments
@@ -0,0 +1,108 @@
+"""Versioned artifact with precomputed fragment embeddings.
+
+Layout of an artifact directory:
+- `embeddings.f16.npy` – normalized embeddings, float16, one row per fragment
+- `manifest.json` – format version, model name, dimension, checksum
+  and fragment ids, texts and metadata in the row order
+"""
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT_VERSION = 1
+EMBEDDINGS_FILE = "embeddings.f16.npy"
+MANIFEST_FILE = "manifest.json"
+# Rows hashed at a time, so checking a memory-mapped artifact doesn't copy it
+HASH_BLOCK_ROWS = 4096
+
+
+def _embeddings_sha256(embeddings: np.ndarray) -> str:
+    digest = hashlib.sha256()
+    for start in range(0, len(embeddings), HASH_BLOCK_ROWS):
+        digest.update(embeddings[start:start + HASH_BLOCK_ROWS].tobytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class EmbeddingArtifact:
+    """Fragments with their embeddings, ready to be written to a vector store."""
+    model_name: str
+    dimension: int
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Dict[str, Any]]
+    embeddings: np.ndarray  # (count, dimension), float16
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self, path: str) -> None:
+        """Write the artifact to a directory."""
+        artifact_path = Path(path)
+        artifact_path.mkdir(parents=True, exist_ok=True)
+        embeddings = np.ascontiguousarray(self.embeddings, dtype=np.float16)
+        np.save(artifact_path / EMBEDDINGS_FILE, embeddings)
+        manifest = {
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "model_name": self.model_name,
+            "dimension": self.dimension,
+            "count": len(self.ids),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "embeddings_sha256": _embeddings_sha256(embeddings),
+            "ids": self.ids,
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+        }
+        with open(artifact_path / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        logger.info("Saved embedding artifact with %d fragments to %s",
+                    len(self.ids), artifact_path)
+
+    @classmethod
+    def load(cls, path: str, model_name: str,
+             dimension: int) -> "EmbeddingArtifact":
+        """Load an artifact, checking it was built for the expected model
+        and its embeddings are the ones described by the manifest."""
+        artifact_path = Path(path)
+        with open(artifact_path / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        if manifest["format_version"] != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported artifact format {manifest['format_version']}, "
+                f"expected {ARTIFACT_FORMAT_VERSION}")
+        if manifest["model_name"] != model_name or manifest["dimension"] != dimension:
+            raise ValueError(
+                f"Artifact was built for {manifest['model_name']} "
+                f"(dim {manifest['dimension']}), but {model_name} "
+                f"(dim {dimension}) is configured")
+
+        embeddings = np.load(artifact_path / EMBEDDINGS_FILE, mmap_mode='r')
+        if embeddings.shape != (manifest["count"], dimension):
+            raise ValueError(
+                f"Artifact embeddings have shape {embeddings.shape}, "
+                f"expected {(manifest['count'], dimension)}")
+        if _embeddings_sha256(embeddings) != manifest["embeddings_sha256"]:
+            raise ValueError(
+                f"Artifact embeddings don't match the manifest checksum, "
+                f"{artifact_path / EMBEDDINGS_FILE} is corrupted or "
+                f"from another build")
+
+        logger.info("Loaded embedding artifact with %d fragments from %s",
+                    manifest["count"], artifact_path)
+        return cls(
+            model_name=manifest["model_name"],
+            dimension=manifest["dimension"],
+            ids=manifest["ids"],
+            documents=manifest["documents"],
+            metadatas=manifest["metadatas"],
+            embeddings=embeddings,
+        )
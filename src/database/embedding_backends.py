@@ -0,0 +1,127 @@
+"""Embedding model backends selected by EMBEDDING_BACKEND.
+
+Every backend exposes the LangChain `Embeddings` interface
+(`embed_documents` / `embed_query`) and returns normalized vectors.
+"""
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("huggingface", "onnx", "remote")
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain wrapper around an already loaded `SentenceTransformer`."""
+
+    def __init__(self, model, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True,
+            convert_to_numpy=True, show_progress_bar=False).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def load_huggingface(model_name: str) -> Embeddings:
+    """Full-precision PyTorch model, on GPU when available."""
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    logger.info("Using device: %s", device)
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': device},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+def load_onnx(model_name: str, quantization: Optional[str],
+              cache_path: str) -> Embeddings:
+    """ONNX Runtime model on CPU, int8 dynamically quantized for `quantization`.
+
+    The model is exported once to `cache_path` and loaded from there
+    afterwards, so the bot process never imports PyTorch weights again.
+    """
+    from sentence_transformers import (SentenceTransformer,
+                                       export_dynamic_quantized_onnx_model)
+
+    model_path = Path(cache_path) / model_name.replace('/', '__')
+    file_name = (f"onnx/model_qint8_{quantization}.onnx" if quantization
+                 else "onnx/model.onnx")
+    if not (model_path / file_name).exists():
+        logger.info("Exporting %s to ONNX at %s, it is done only once",
+                    model_name, model_path)
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save(str(model_path))
+        if quantization:
+            export_dynamic_quantized_onnx_model(
+                model, quantization, str(model_path))
+
+    logger.info("Loading ONNX embeddings model %s", model_path / file_name)
+    model = SentenceTransformer(
+        str(model_path), backend="onnx", device="cpu",
+        model_kwargs={"file_name": file_name})
+    return SentenceTransformerEmbeddings(model)
+
+
+class RemoteEmbeddings(Embeddings):
+    """Client of the shared embedding server (src/embedding_server.py).
+
+    The model lives in the server process, so bot replicas stay lightweight.
+    Connects over TCP to `url` or over the Unix socket `socket_path`.
+    Requests are blocking: the bot calls the client from its RAG executor,
+    with concurrent queries already merged by its embedding batcher.
+    """
+
+    def __init__(self, url: str, model_name: str,
+                 socket_path: Optional[str] = None, timeout: float = 30.0):
+        import httpx
+
+        transport = httpx.HTTPTransport(uds=socket_path) if socket_path else None
+        self._client = httpx.Client(
+            base_url=url, transport=transport, timeout=timeout)
+
+        server = self._client.get("/health")
+        server.raise_for_status()
+        info = server.json()
+        if info["model"] != model_name:
+            raise ValueError(
+                f"Embedding server at {url} serves {info['model']}, "
+                f"expected {model_name}")
+        logger.info("Using embedding server at %s (%s, %s backend)",
+                    socket_path or url, info["model"], info["backend"])
+
+    @staticmethod
+    def _parse(response) -> List[List[float]]:
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._parse(self._client.post("/embed", json={"texts": texts}))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def load_embeddings(backend: str, model_name: str,
+                    onnx_quantization: Optional[str] = None,
+                    onnx_path: Optional[str] = None,
+                    server_url: Optional[str] = None,
+                    server_socket: Optional[str] = None) -> Embeddings:
+    """Load the embedding model of a backend, see EMBEDDING_BACKENDS."""
+    if backend == "huggingface":
+        return load_huggingface(model_name)
+    if backend == "onnx":
+        return load_onnx(model_name, onnx_quantization, onnx_path)
+    if backend == "remote":
+        return RemoteEmbeddings(server_url, model_name, socket_path=server_socket)
+    raise ValueError(f"Unknown embedding backend: {backend}")
@@ -0,0 +1,137 @@
+"""Persistent cache of query embeddings."""
+import logging
+import re
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = ' ?!.,;:…'
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different questions share a key.
+    E.g. '  Что делать при ФОЛЕ?? ' -> 'что делать при фоле'
+    """
+    query = _WHITESPACE.sub(' ', query.lower().replace('ё', 'е'))
+    return query.strip(_TRAILING_PUNCTUATION)
+
+
+class QueryEmbeddingCache:
+    """Bounded in-memory LRU of query embeddings backed by SQLite.
+
+    Keys are (model name, normalized query), so switching the embedding
+    model never returns stale vectors. Memory misses fall back to disk,
+    which makes the cache survive bot restarts.
+
+    The memory and disk parts have separate locks, and `get_memory` /
+    `remember` never touch SQLite, so async callers can use them on the
+    event loop and leave `get` / `persist` to a worker thread.
+    """
+
+    def __init__(self, path: Optional[str], model_name: str,
+                 max_size: int = 1024):
+        """
+        Parameters
+        ----------
+        path : str | None
+            SQLite file, if empty the cache is memory-only
+        model_name : str
+            Embedding model name, part of the cache key
+        max_size : int, optional
+            Max number of vectors kept in memory, by default 1024
+        """
+        self.model_name = model_name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, query))")
+            self._db.commit()
+
+    def get_memory(self, query: str) -> Optional[List[float]]:
+        """Get embedding for a query from memory only, None if not there.
+        A miss is not counted, the caller is expected to try `get` next."""
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return vector
+
+    def get(self, query: str) -> Optional[List[float]]:
+        """Get cached embedding for a query, None on miss."""
+        vector = self.get_memory(query)
+        if vector is not None:
+            return vector
+
+        key = normalize_query(query)
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings "
+                    "WHERE model = ? AND query = ?",
+                    (self.model_name, key)).fetchone()
+            if row is not None:
+                vector = array('f', row[0]).tolist()
+                with self._lock:
+                    self._remember(key, vector)
+                    self.hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query: str, vector: List[float]) -> None:
+        """Store embedding for a query in memory and on disk."""
+        self.remember(query, vector)
+        self.persist(query, vector)
+
+    def remember(self, query: str, vector: List[float]) -> None:
+        """Store embedding for a query in memory only."""
+        with self._lock:
+            self._remember(normalize_query(query), list(vector))
+
+    def persist(self, query: str, vector: List[float]) -> None:
+        """Store embedding for a query on disk only."""
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings "
+                "(model, query, vector) VALUES (?, ?, ?)",
+                (self.model_name, normalize_query(query),
+                 array('f', vector).tobytes()))
+            self._db.commit()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "memory_size": len(self._memory),
+        }
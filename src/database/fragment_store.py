@@ -0,0 +1,117 @@
+"""Read-only in-memory store of the rule fragments served by the bot."""
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+PATH_SEPARATOR = " > "
+_PARAGRAPH_NUMBER = re.compile(r'\d+(?:\.\d+)*')
+# Document prefix, if any, ends with a space: "4.3", "ЮФО 4.3"
+_PARAGRAPH_ID = re.compile(r'(.*\s)?(\d+(?:\.\d+)*)')
+
+
+def split_paragraph(paragraph: str) -> Optional[Tuple[str, Tuple[int, ...]]]:
+    """Document prefix and number parts of a numbered paragraph id,
+    None for other fragments (e.g. comments).
+    E.g. "4.3" -> ("", (4, 3)), "ЮФО 4.3" -> ("ЮФО ", (4, 3))"""
+    match = _PARAGRAPH_ID.fullmatch(paragraph)
+    if match is None:
+        return None
+    return (match.group(1) or '',
+            tuple(int(part) for part in match.group(2).split('.')))
+
+
+def _level_key(level: str, prefix: str) -> str:
+    """Paragraph id of a hierarchy heading, e.g. "6.7. Фолы" -> "6.7",
+    or "ЮФО 6.7" in a prefixed document, so a heading matches
+    the paragraph fragment it comes from."""
+    number = level.split(' ', 1)[0].rstrip('.')
+    return f"{prefix}{number}" if _PARAGRAPH_NUMBER.fullmatch(number) else level
+
+
+class StoredFragment:
+    """A fragment with everything the serving path needs precomputed:
+    heading levels (interned, so fragments of one section share the strings),
+    document order and the text line used in the LLM context."""
+
+    __slots__ = ("row", "paragraph", "prefix", "content", "levels",
+                 "level_keys", "printed_keys", "order", "line", "metadata")
+
+    def __init__(self, row: int, paragraph: str, content: str, full_path: str):
+        self.row = row
+        self.paragraph = paragraph
+        self.content = content
+        full_path = sys.intern(full_path or '')
+        self.levels: Tuple[str, ...] = tuple(
+            sys.intern(level) for level in full_path.split(PATH_SEPARATOR)
+        ) if full_path else ()
+        numbered = split_paragraph(paragraph)
+        # Headings of a prefixed document are numbered without the prefix
+        self.prefix = numbered[0] if numbered else ''
+        self.level_keys = tuple(sys.intern(_level_key(level, self.prefix))
+                                for level in self.levels)
+        if numbered:
+            # Numbered paragraphs by document and in the order of its rules,
+            # comments after them
+            self.order: Tuple = (0,) + numbered
+            self.line = f"{paragraph}. {content}"
+            # Children of this paragraph don't repeat its heading
+            self.printed_keys = self.level_keys + (paragraph,)
+        else:
+            self.order = (1, paragraph)
+            if self.levels and content.startswith(self.levels[-1]):
+                # Comments repeat their heading as the first content line
+                content = content[len(self.levels[-1]):].lstrip('\n')
+            self.line = content
+            self.printed_keys = self.level_keys
+        # Shared by every search result of this fragment
+        self.metadata = {"paragraph": paragraph, "full_path": full_path}
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "StoredFragment":
+        """Record of a search result that is not in the store."""
+        metadata = result['metadata']
+        return cls(-1, metadata['paragraph'], result['content'],
+                   metadata.get('full_path') or '')
+
+
+class FragmentStore:
+    """All fragments of one rules version, addressed by integer row.
+
+    Search results reference records instead of carrying their own copies
+    of the text and metadata, so answering a question allocates only
+    the small result dicts.
+    """
+
+    def __init__(self, ids: List[str], documents: List[str],
+                 metadatas: List[Dict[str, Any]]):
+        self._fragments = [
+            StoredFragment(row, id_, document, (metadata or {}).get('full_path'))
+            for row, (id_, document, metadata) in enumerate(
+                zip(ids, documents, metadatas))]
+        self._rows = {fragment.paragraph: fragment.row
+                      for fragment in self._fragments}
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def __getitem__(self, row: int) -> StoredFragment:
+        return self._fragments[row]
+
+    def row(self, paragraph: str) -> Optional[int]:
+        return self._rows.get(paragraph)
+
+    def result(self, row: int, relevance_score: float) -> Dict[str, Any]:
+        """Fragment of a row in the search results format."""
+        fragment = self._fragments[row]
+        return {
+            "content": fragment.content,
+            "metadata": fragment.metadata,
+            "relevance_score": relevance_score,
+            "fragment": fragment,
+        }
+
+
+def stored_fragment(result: Dict[str, Any]) -> StoredFragment:
+    """Record of a search result, built on the fly for results from outside
+    the store (e.g. produced by a different rules version)."""
+    return result.get("fragment") or StoredFragment.from_result(result)
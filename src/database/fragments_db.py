@@ -1,60 +1,292 @@
 """RAG interface for interacting with stored fragments database."""
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Any, Dict, List
+import math
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import (Any, Callable, Dict, Iterable, List, NamedTuple, Optional,
+                    Set, Tuple)
+from uuid import uuid4
 
-import chromadb
-import torch
-from chromadb.config import Settings
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import numpy as np
 from tqdm import tqdm
 
-from consts import (CHROMA_CLIENT_AUTHN_PROVIDER, CHROMA_HOST, CHROMA_PASSWORD,
-                    CHROMA_PORT, CHROMA_USER, EMBEDDING_MODEL_NAME)
+from consts import (CHROMA_ASYNC, CHROMA_CLIENT_AUTHN_PROVIDER, CHROMA_HOST,
+                    CHROMA_MAX_CONNECTIONS, CHROMA_PASSWORD, CHROMA_PORT,
+                    CHROMA_USER, EMBEDDING_ARTIFACT_PATH,
+                    EMBEDDING_BACKEND, EMBEDDING_BATCH_MAX_SIZE,
+                    EMBEDDING_BATCH_WAIT_MS, EMBEDDING_CACHE_PATH,
+                    EMBEDDING_CACHE_SIZE, EMBEDDING_COMPAT_MIN_SIMILARITY,
+                    EMBEDDING_DIMENSION, EMBEDDING_MODEL_NAME,
+                    EMBEDDING_ONNX_PATH, EMBEDDING_ONNX_QUANTIZATION,
+                    EMBEDDING_SERVER_SOCKET, EMBEDDING_SERVER_URL,
+                    HYBRID_CANDIDATES, INGEST_CHECKPOINT_PATH,
+                    INGEST_CHUNK_SIZE, LEXICAL_FAST_PATH_CONFIDENCE,
+                    LEXICAL_FAST_PATH_MARGIN,
+                    LEXICAL_INDEX_PATH, LOCAL_INDEX_PATH, RAG_EXECUTOR_WORKERS,
+                    RULES_VERSION_CHECK_S, SEARCH_MODE, VECTOR_BACKEND)
+from database.embedding_artifact import EmbeddingArtifact
+from database.embedding_backends import load_embeddings
+from database.embedding_cache import QueryEmbeddingCache
+from database.fragment_store import FragmentStore
+from database.lexical_index import LexicalIndex
+from database.local_index import LocalVectorIndex
+from database.paragraph_index import ParagraphIndex
 from database.rule_fragment import RuleFragment
+from metrics import span
 
 logger = logging.getLogger(__name__)
 
+# Fields of vector search results served from the fragment store or not
+STORE_INCLUDE = ("distances",)
+FULL_INCLUDE = ("documents", "metadatas", "distances")
+
+
+class _ServingData(NamedTuple):
+    """Fragment store and paragraph index of one rules version,
+    published together and never modified."""
+    version: Optional[str]
+    store: FragmentStore
+    paragraph_index: ParagraphIndex
+
+
+class QueryEmbeddingBatcher:
+    """Collect concurrent query embedding requests into batched encodes.
+
+    The first query of a batch waits at most `max_wait_ms` for others to join;
+    a batch is flushed early once it reaches `max_batch_size`.
+    One forward pass is run per batch and every caller gets its own vector.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        executor: Executor,
+        max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS
+    ):
+        self._embed_batch = embed_batch
+        self._executor = executor
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed a single query, sharing the forward pass with concurrent ones."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical queries in one batch are encoded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        loop = asyncio.get_running_loop()
+        try:
+            vectors = await loop.run_in_executor(
+                self._executor, self._embed_batch, texts)
+        except Exception as e:
+            logger.error("Failed to embed query batch: %s", str(e))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug("Embedded batch of %d queries", len(texts))
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
 
 class RAGInterface:
     def __init__(
         self,
-        embedding_model_name: str = EMBEDDING_MODEL_NAME
+        embedding_model_name: str = EMBEDDING_MODEL_NAME,
+        executor_workers: int = RAG_EXECUTOR_WORKERS,
+        backend: str = VECTOR_BACKEND,
+        local_index_path: str = LOCAL_INDEX_PATH,
+        artifact_path: Optional[str] = EMBEDDING_ARTIFACT_PATH,
+        embedding_backend: str = EMBEDDING_BACKEND,
+        async_chroma: bool = CHROMA_ASYNC
     ):
-        """Initialize RAG interface with ChromaDB and embedding model."""
+        """Initialize RAG interface with a vector backend and embedding model.
+
+        Parameters
+        ----------
+        backend : str, optional
+            "chroma" for the Chroma HTTP server or "local" for the in-process
+            memory-mapped index at `local_index_path`, by default VECTOR_BACKEND
+        artifact_path : str | None, optional
+            Precomputed embedding artifact used to fill an empty local index,
+            by default EMBEDDING_ARTIFACT_PATH
+        embedding_backend : str, optional
+            "huggingface" for the PyTorch model, "onnx" for the quantized
+            ONNX Runtime one or "remote" for the shared embedding server,
+            by default EMBEDDING_BACKEND
+        async_chroma : bool, optional
+            Run async searches of the "chroma" backend over a pooled async
+            client, merging concurrent ones into one query, by default CHROMA_ASYNC
+        """
         self._embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.backend = backend
         self._embeddings = None
-        self.client = chromadb.HttpClient(
-            host=CHROMA_HOST,
-            port=CHROMA_PORT,
-            settings=Settings(
+        # Bounded pool for blocking embedding and Chroma calls,
+        # so async callers never block the event loop.
+        self._executor = ThreadPoolExecutor(
+            max_workers=executor_workers,
+            thread_name_prefix="rag")
+        self._batcher = QueryEmbeddingBatcher(
+            embed_batch=self._embed_query_batch,
+            executor=self._executor)
+        # Backends give slightly different vectors, don't mix them in the cache
+        cache_model_name = (embedding_model_name if embedding_backend == "huggingface"
+                            else f"{embedding_model_name}@{embedding_backend}")
+        self.query_cache = QueryEmbeddingCache(
+            path=EMBEDDING_CACHE_PATH,
+            model_name=cache_model_name,
+            max_size=EMBEDDING_CACHE_SIZE)
+
+        # Both backends expose the same collection API:
+        # upsert / delete / get / query / count
+        self._async_collection = None
+        self._vector_batcher = None
+        if backend == "chroma":
+            # Imported only for this backend, chromadb takes seconds to import
+            import chromadb
+            from chromadb.config import Settings
+
+            from database.async_chroma import (AsyncChromaCollection,
+                                               VectorQueryBatcher)
+
+            auth_settings = dict(
                 chroma_client_auth_provider=CHROMA_CLIENT_AUTHN_PROVIDER,
-                chroma_client_auth_credentials=f"{CHROMA_USER}:{CHROMA_PASSWORD}"
+                chroma_client_auth_credentials=f"{CHROMA_USER}:{CHROMA_PASSWORD}")
+            self.client = chromadb.HttpClient(
+                host=CHROMA_HOST,
+                port=CHROMA_PORT,
+                settings=Settings(**auth_settings)
             )
-        )
+            # Embeddings are always computed by us, not by Chroma
+            self.rules_collection = self.client.get_or_create_collection(
+                name="rule_fragments",
+                embedding_function=None,
+            )
+            if async_chroma:
+                # The collection is opened on the first search,
+                # inside the bot's event loop
+                self._async_collection = AsyncChromaCollection(
+                    host=CHROMA_HOST,
+                    port=CHROMA_PORT,
+                    settings=Settings(
+                        **auth_settings,
+                        chroma_http_max_connections=CHROMA_MAX_CONNECTIONS,
+                        chroma_http_max_keepalive_connections=CHROMA_MAX_CONNECTIONS))
+                self._vector_batcher = VectorQueryBatcher(
+                    self._async_collection.query)
+        elif backend == "local":
+            self.client = None
+            self.rules_collection = LocalVectorIndex(local_index_path)
+        else:
+            raise ValueError(f"Unknown vector backend: {backend}")
 
-        # Initialize vectorstores for different collections
-        self.rules_vectorstore = Chroma(
-            collection_name="rule_fragments",
-            embedding_function=self.embeddings,
-            client=self.client,
-        )
+        self._rules_version = None
+        self._rules_version_checked_at = float('-inf')
+        self.lexical_index_path = LEXICAL_INDEX_PATH
+        self._lexical_index: Optional[LexicalIndex] = None
+        self._serving: Optional[_ServingData] = None
+        self._serving_lock = threading.Lock()
+        if (backend == "local" and not self.rules_collection.count()
+                and artifact_path and Path(artifact_path).exists()):
+            # Fresh deployment: fill the local index without running the model
+            self.load_artifact(EmbeddingArtifact.load(
+                artifact_path,
+                model_name=embedding_model_name,
+                dimension=EMBEDDING_DIMENSION))
 
     @property
     def embeddings(self):
         """Lazy load embeddings model."""
         if self._embeddings is None:
-            logger.info("Loading embeddings model... It may take some time.")
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            self._embeddings = HuggingFaceEmbeddings(
-                model_name=self._embedding_model_name,
-                model_kwargs={'device': device},
-                encode_kwargs={'normalize_embeddings': True}
-            )
-            logger.info("Using device: %s", device)
+            logger.info("Loading %s embeddings model... It may take some time.",
+                        self.embedding_backend)
+            self._embeddings = load_embeddings(
+                self.embedding_backend,
+                self._embedding_model_name,
+                onnx_quantization=EMBEDDING_ONNX_QUANTIZATION,
+                onnx_path=EMBEDDING_ONNX_PATH,
+                server_url=EMBEDDING_SERVER_URL,
+                server_socket=EMBEDDING_SERVER_SOCKET)
         return self._embeddings
 
+    def check_embedding_compatibility(
+            self, sample_size: int = 8,
+            min_similarity: float = EMBEDDING_COMPAT_MIN_SIMILARITY) -> float:
+        """Check that the current embedding backend reproduces stored vectors.
+
+        Re-embeds a sample of stored fragments and compares them with
+        their vectors in the collection, e.g. after switching to the ONNX
+        backend without re-ingesting the rules.
+
+        Returns
+        -------
+        float
+            Lowest cosine similarity in the sample, 1.0 for an empty collection
+
+        Raises
+        ------
+        ValueError
+            If dimensions differ or similarity is below `min_similarity`
+        """
+        stored = self.rules_collection.get(
+            limit=sample_size, include=["documents", "embeddings"])
+        if not stored["ids"]:
+            return 1.0
+        stored_vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+        new_vectors = np.asarray(
+            self.embeddings.embed_documents(stored["documents"]), dtype=np.float32)
+        if stored_vectors.shape[1] != new_vectors.shape[1]:
+            raise ValueError(
+                f"{self.embedding_backend} embeddings have dimension "
+                f"{new_vectors.shape[1]}, the collection has {stored_vectors.shape[1]}")
+
+        stored_vectors /= np.linalg.norm(stored_vectors, axis=1, keepdims=True)
+        new_vectors /= np.linalg.norm(new_vectors, axis=1, keepdims=True)
+        similarity = float(np.min(np.sum(stored_vectors * new_vectors, axis=1)))
+        logger.info("Embedding compatibility of the %s backend: "
+                    "min cosine similarity %.4f over %d fragments",
+                    self.embedding_backend, similarity, len(stored["ids"]))
+        if similarity < min_similarity:
+            raise ValueError(
+                f"{self.embedding_backend} embeddings are not compatible with the "
+                f"stored ones (similarity {similarity:.4f} < {min_similarity}), "
+                f"re-ingest the rules with this backend")
+        return similarity
+
     def healthcheck(self):
+        if self.client is None:
+            return f"Local index: {self.rules_collection.count()} fragments"
         return f"Chroma heartbeat: {self.client.heartbeat()}"
 
     def add_rule_fragment(self, fragment: RuleFragment) -> None:
@@ -63,11 +295,14 @@ class RAGInterface:
             chroma_dict = fragment.to_chroma_dict()
 
             # Add to vector store
-            self.rules_vectorstore.add_texts(
-                texts=[chroma_dict["content"]],
+            self.rules_collection.upsert(
+                ids=[chroma_dict["paragraph"]],
+                embeddings=self.embeddings.embed_documents(
+                    [chroma_dict["content"]]),
                 metadatas=[chroma_dict["metadata"]],
-                ids=[chroma_dict["paragraph"]]
+                documents=[chroma_dict["content"]]
             )
+            self._bump_rules_version()
             logger.info(
                 "Added rule fragment %s to vector store", fragment.paragraph)
 
@@ -75,58 +310,606 @@ class RAGInterface:
             logger.error("Failed to add rule fragment: %s", str(e))
             raise
 
-    def search_rules(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
-        """Search for relevant rule fragments."""
+    def search_rules(self, query: str, k: int = 3,
+                     mode: str = SEARCH_MODE) -> List[Dict[str, Any]]:
+        """Search for relevant rule fragments.
+
+        Parameters
+        ----------
+        mode : str, optional
+            "dense" – vector search only, "lexical" – BM25 only,
+            "hybrid" – BM25 fast path for confident lexical hits,
+            otherwise reciprocal rank fusion of both, by default SEARCH_MODE
+        """
+        with span("search_rules"):
+            if mode == "dense":
+                return self.search_rules_by_vector(self.embed_query(query), k=k)
+
+            lexical_results = self.search_rules_lexical(query, k=HYBRID_CANDIDATES)
+            if mode == "lexical" or self._is_confident(lexical_results, k):
+                return lexical_results[:k]
+            dense_results = self.search_rules_by_vector(
+                self.embed_query(query), k=HYBRID_CANDIDATES)
+            return self._fuse(dense_results, lexical_results, k)
+
+    def search_rules_lexical(
+            self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Search for rule fragments with BM25, without embedding the query.
+        Relevance score is the lexical confidence, see `LexicalIndex.search`."""
+        index = self.lexical_index
+        store = self.fragment_store
+        with span("lexical_query"):
+            hits = index.search(query, k=k)
+        results = []
+        for row, _, confidence in hits:
+            store_row = store.row(index.ids[row])
+            # Both are built from the same rules version, a fragment is only
+            # missing while one of them catches up with a new ingestion
+            if store_row is not None:
+                results.append(store.result(store_row, confidence))
+        return results
+
+    @staticmethod
+    def _is_confident(lexical_results: List[Dict[str, Any]], k: int) -> bool:
+        """Whether lexical hits are good enough to skip vector search:
+        the top hit matches the whole query and clearly beats the next one."""
+        if len(lexical_results) < k:
+            return False
+        top = lexical_results[0]["relevance_score"]
+        runner_up = (lexical_results[1]["relevance_score"]
+                     if len(lexical_results) > 1 else 0.0)
+        return (top >= LEXICAL_FAST_PATH_CONFIDENCE
+                and runner_up <= top * (1 - LEXICAL_FAST_PATH_MARGIN))
+
+    @staticmethod
+    def _fuse(dense_results: List[Dict[str, Any]],
+              lexical_results: List[Dict[str, Any]],
+              k: int, rrf_k: int = 60) -> List[Dict[str, Any]]:
+        """Reciprocal rank fusion of two result lists."""
+        fused: Dict[str, Dict[str, Any]] = {}
+        for results in (dense_results, lexical_results):
+            for rank, result in enumerate(results):
+                paragraph = result["metadata"]["paragraph"]
+                entry = fused.setdefault(paragraph, {**result, "relevance_score": 0.0})
+                entry["relevance_score"] += 1.0 / (rrf_k + rank + 1)
+        return sorted(fused.values(),
+                      key=lambda result: result["relevance_score"],
+                      reverse=True)[:k]
+
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        """BM25 index of the current rules version.
+        Loaded from disk if it matches the collection, rebuilt otherwise."""
+        version = self.get_rules_version()
+        if self._lexical_index is None and Path(self.lexical_index_path).exists():
+            self._lexical_index = LexicalIndex.load(self.lexical_index_path)
+        if self._lexical_index is None or self._lexical_index.rules_version != version:
+            self._lexical_index = self._build_lexical_index(version)
+        return self._lexical_index
+
+    def _serving_data(self) -> _ServingData:
+        """Fragment store and paragraph index of the current rules version.
+        Both are built under a lock and published as one object, so a
+        concurrent search never pairs an index with another version's store."""
+        version = self.get_rules_version()
+        data = self._serving
+        if data is None or data.version != version:
+            with self._serving_lock:
+                data = self._serving
+                if data is None or data.version != version:
+                    stored = self.rules_collection.get(
+                        include=["documents", "metadatas"])
+                    store = FragmentStore(
+                        ids=stored["ids"],
+                        documents=stored["documents"],
+                        metadatas=stored["metadatas"])
+                    data = _ServingData(version, store, ParagraphIndex(store))
+                    self._serving = data
+        return data
+
+    def _current_store(self) -> Optional[FragmentStore]:
+        """Loaded fragment store if it matches the last known rules version,
+        without reading the backend, so it can be called on the event loop."""
+        data = self._serving
+        if data is None or data.version != self._rules_version:
+            return None
+        return data.store
+
+    @property
+    def fragment_store(self) -> FragmentStore:
+        """Fragments of the current rules version, shared by search results."""
+        return self._serving_data().store
+
+    @property
+    def paragraph_index(self) -> ParagraphIndex:
+        """Paragraph number index of the current rules version."""
+        return self._serving_data().paragraph_index
+
+    def lookup_paragraphs(
+            self, query: str) -> Tuple[bool, List[Dict[str, Any]]]:
+        """Fragments of the paragraphs a query refers to by number.
+
+        Returns
+        -------
+        Tuple[bool, List[Dict[str, Any]]]
+            Whether the query is a direct lookup ("что в пункте 6.1.2")
+            that can be answered with the paragraph text alone, and the
+            fragments: whole subtrees for direct lookups,
+            the cited paragraphs themselves otherwise.
+        """
+        index = self.paragraph_index
+        references = index.find_references(query)
+        if index.is_direct_lookup(query):
+            return True, [fragment for paragraph in references
+                          for fragment in index.subtree(paragraph)]
+        return False, [index.get(paragraph) for paragraph in references
+                       if paragraph in index]
+
+    async def alookup_paragraphs(
+            self, query: str) -> Tuple[bool, List[Dict[str, Any]]]:
+        """Async `lookup_paragraphs` on the bounded RAG executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.lookup_paragraphs, query)
+
+    def _build_lexical_index(self, rules_version: Optional[str]) -> LexicalIndex:
+        stored = self.rules_collection.get(include=["documents", "metadatas"])
+        return LexicalIndex.build(
+            ids=stored["ids"],
+            documents=stored["documents"],
+            metadatas=stored["metadatas"],
+            rules_version=rules_version)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing cached vectors for repeated questions."""
+        embedding = self.query_cache.get(query)
+        if embedding is not None:
+            return embedding
         try:
-            results = self.rules_vectorstore.similarity_search_with_relevance_scores(
-                query,
-                k=k
-            )
+            with span("embedding"):
+                embedding = self.embeddings.embed_query(query)
+        except Exception as e:
+            logger.error("Failed to embed query: %s", str(e))
+            raise
+        self.query_cache.put(query, embedding)
+        return embedding
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """Batched query embedding used by the batcher."""
+        with span("embedding"):
+            return self.embeddings.embed_documents(texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async `embed_query`: cache misses go through the batcher.
+        Only the in-memory part of the cache is used on the event loop,
+        its SQLite reads and writes run on the bounded RAG executor."""
+        embedding = self.query_cache.get_memory(query)
+        if embedding is not None:
+            return embedding
+        loop = asyncio.get_running_loop()
+        embedding = await loop.run_in_executor(
+            self._executor, self.query_cache.get, query)
+        if embedding is not None:
+            return embedding
+        embedding = await self._batcher.embed(query)
+        self.query_cache.remember(query, embedding)
+        # The answer doesn't wait for the disk write
+        loop.run_in_executor(
+            self._executor, self.query_cache.persist, query, embedding
+        ).add_done_callback(self._log_persist_error)
+        return embedding
 
-            formatted_results = []
-            for doc, score in results:
-                formatted_results.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "relevance_score": score
-                })
+    @staticmethod
+    def _log_persist_error(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Failed to persist query embedding: %s",
+                         str(future.exception()))
+
+    def search_rules_by_vector(
+            self, embedding: List[float], k: int = 3) -> List[Dict[str, Any]]:
+        """Search for relevant rule fragments by a precomputed query embedding."""
+        return self.search_rules_by_vectors([embedding], k)[0]
 
-            return formatted_results
+    def search_rules_by_vectors(
+            self, embeddings: List[List[float]], k: int = 3
+    ) -> List[List[Dict[str, Any]]]:
+        """Search by several query embeddings in one collection query."""
+        try:
+            store = self.fragment_store
+            with span("vector_query"):
+                results = self.rules_collection.query(
+                    query_embeddings=embeddings,
+                    n_results=k,
+                    include=list(STORE_INCLUDE)
+                )
+            return self._format_results(results, store)
 
         except Exception as e:
             logger.error("Failed to search rules: %s", str(e))
             raise
 
-    def batch_add_rule_fragments(self, fragments: List[RuleFragment]) -> None:
-        """Add multiple rule fragments in batch."""
-        try:
-            texts = []
-            metadatas = []
-            ids = []
+    def _format_results(self, results: Dict[str, List[List[Any]]],
+                        store: Optional[FragmentStore]
+                        ) -> List[List[Dict[str, Any]]]:
+        """Collection query results -> fragments of each query.
+
+        With the fragment store of the queried rules version, results hold
+        only ids and distances (see STORE_INCLUDE) and fragments are taken
+        from the store. Without it, they are built from the returned
+        documents and metadatas (FULL_INCLUDE).
+        """
+        formatted = []
+        for query_row, (ids, distances) in enumerate(
+                zip(results["ids"], results["distances"])):
+            fragments = []
+            for hit, (id_, distance) in enumerate(zip(ids, distances)):
+                score = self._relevance_score(distance)
+                if store is None:
+                    fragments.append({
+                        "content": results["documents"][query_row][hit],
+                        "metadata": results["metadatas"][query_row][hit],
+                        "relevance_score": score
+                    })
+                    continue
+                row = store.row(id_)
+                # Written after the rules version was read,
+                # served once the store is reloaded for the new version
+                if row is not None:
+                    fragments.append(store.result(row, score))
+            formatted.append(fragments)
+        return formatted
+
+    def search_rules_batch(
+            self, queries: List[str], k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Dense search for several queries (e.g. rephrasings of a question):
+        uncached queries are embedded in one batch and all of them are
+        searched in one collection query."""
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(
+            query for query, embedding in zip(queries, embeddings)
+            if embedding is None))
+        if missing:
+            computed = dict(zip(missing, self._embed_query_batch(missing)))
+            for query, embedding in computed.items():
+                self.query_cache.put(query, embedding)
+            embeddings = [computed[query] if embedding is None else embedding
+                          for query, embedding in zip(queries, embeddings)]
+        return self.search_rules_by_vectors(embeddings, k)
+
+    async def asearch_rules_batch(
+            self, queries: List[str], k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Async `search_rules_batch`: the queries share the embedding batcher
+        and are searched in one collection query."""
+        embeddings = await asyncio.gather(
+            *(self.aembed_query(query) for query in queries))
+        return await self.asearch_rules_by_vectors(list(embeddings), k)
+
+    async def asearch_rules(
+            self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Search for relevant rule fragments without blocking the event loop.
+        The query is embedded together with concurrent ones by the batcher,
+        and the Chroma query runs on the bounded RAG executor."""
+        _, results = await self.asearch_rules_with_vector(query, k)
+        return results
+
+    async def asearch_rules_with_vector(
+            self, query: str, k: int = 3, mode: str = SEARCH_MODE
+    ) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+        """Async `search_rules` that also returns the query embedding,
+        None if a confident lexical hit made embedding unnecessary."""
+        with span("search_rules"):
+            return await self._asearch_rules_with_vector(query, k, mode)
+
+    async def _asearch_rules_with_vector(
+            self, query: str, k: int, mode: str
+    ) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+        if mode == "dense":
+            embedding = await self.aembed_query(query)
+            return embedding, await self.asearch_rules_by_vector(embedding, k)
+
+        loop = asyncio.get_running_loop()
+        lexical_results = await loop.run_in_executor(
+            self._executor, self.search_rules_lexical, query, HYBRID_CANDIDATES)
+        if mode == "lexical" or self._is_confident(lexical_results, k):
+            return None, lexical_results[:k]
+        embedding = await self.aembed_query(query)
+        dense_results = await self.asearch_rules_by_vector(
+            embedding, HYBRID_CANDIDATES)
+        return embedding, self._fuse(dense_results, lexical_results, k)
+
+    async def asearch_rules_by_vector(
+            self, embedding: List[float], k: int = 3) -> List[Dict[str, Any]]:
+        """Async `search_rules_by_vector`: over the async Chroma client,
+        sharing a query with concurrent searches, or on the bounded
+        RAG executor."""
+        if self._vector_batcher is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self.search_rules_by_vector, embedding, k)
+        store = self._current_store()
+        with span("vector_query"):
+            results = await self._vector_batcher.query(
+                embedding, k, STORE_INCLUDE if store is not None else FULL_INCLUDE)
+        return self._format_results(results, store)[0]
+
+    async def asearch_rules_by_vectors(
+            self, embeddings: List[List[float]], k: int = 3
+    ) -> List[List[Dict[str, Any]]]:
+        """Async `search_rules_by_vectors`."""
+        if self._async_collection is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self.search_rules_by_vectors, embeddings, k)
+        store = self._current_store()
+        with span("vector_query"):
+            results = await self._async_collection.query(
+                embeddings, k, STORE_INCLUDE if store is not None else FULL_INCLUDE)
+        return self._format_results(results, store)
+
+    def get_rules_version(
+            self, max_age: float = RULES_VERSION_CHECK_S) -> Optional[str]:
+        """Version marker of the rules collection, changes on every ingestion.
+        The value is re-read from the backend at most every `max_age` seconds.
+        """
+        now = time.monotonic()
+        if now - self._rules_version_checked_at >= max_age:
+            if self.client is None:
+                metadata = self.rules_collection.metadata
+            else:
+                # Collection objects cache metadata, fetch a fresh one
+                metadata = self.client.get_collection("rule_fragments").metadata
+            self._rules_version = (metadata or {}).get("rules_version")
+            self._rules_version_checked_at = now
+        return self._rules_version
 
-            for fragment in tqdm(fragments):
-                chroma_dict = fragment.to_chroma_dict()
-                texts.append(chroma_dict["content"])
-                metadatas.append(chroma_dict["metadata"])
-                ids.append(chroma_dict["paragraph"])
+    async def aget_rules_version(self) -> Optional[str]:
+        """Async `get_rules_version` on the bounded RAG executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.get_rules_version)
+
+    def _bump_rules_version(self) -> None:
+        """Mark the rules collection as changed, e.g. for answer caches,
+        and rebuild the lexical index kept alongside it."""
+        metadata = {
+            key: value
+            for key, value in (self.rules_collection.metadata or {}).items()
+            # Chroma refuses to modify index parameters
+            if not key.startswith("hnsw:")
+        }
+        metadata["rules_version"] = uuid4().hex
+        self.rules_collection.modify(metadata=metadata)
+        self._rules_version = metadata["rules_version"]
+        self._rules_version_checked_at = time.monotonic()
+        self._lexical_index = self._build_lexical_index(self._rules_version)
+        self._lexical_index.save(self.lexical_index_path)
+
+    def batch_add_rule_fragments(
+            self,
+            fragments: Iterable[RuleFragment],
+            chunk_size: int = INGEST_CHUNK_SIZE,
+            checkpoint_path: Optional[str] = INGEST_CHECKPOINT_PATH) -> None:
+        """Add multiple rule fragments in chunks.
+
+        Embedding of the next chunk overlaps with writing the current one.
+        After every written chunk a checkpoint is saved, so an interrupted
+        run over the same fragments resumes from the last written chunk.
+        """
+        try:
+            fragments = list(fragments)
+            chunks = [fragments[i:i + chunk_size]
+                      for i in range(0, len(fragments), chunk_size)]
+            fingerprint = self._ingestion_fingerprint(fragments, chunk_size)
+            done = self._load_checkpoint(checkpoint_path, fingerprint)
+            if done:
+                logger.info("Resuming ingestion from chunk %d/%d",
+                            done + 1, len(chunks))
 
             logger.info(
                 "Getting embeddings and loading into vector store... It may take a while.")
-            self.rules_vectorstore.add_texts(
-                texts=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
-            logger.info("Added %d rule fragments in batch", len(fragments))
+            start = time.perf_counter()
+            added = 0
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed") as embedder, \
+                    tqdm(total=len(fragments), initial=len(fragments[:done * chunk_size]),
+                         unit="fragment") as progress:
+                pending = (embedder.submit(self._embed_chunk, chunks[done])
+                           if done < len(chunks) else None)
+                for index in range(done, len(chunks)):
+                    ids, texts, metadatas, embeddings = pending.result()
+                    if index + 1 < len(chunks):
+                        pending = embedder.submit(
+                            self._embed_chunk, chunks[index + 1])
+
+                    self.rules_collection.upsert(
+                        ids=ids,
+                        embeddings=embeddings,
+                        metadatas=metadatas,
+                        documents=texts
+                    )
+                    self._save_checkpoint(checkpoint_path, fingerprint, index + 1)
+                    added += len(ids)
+                    progress.update(len(ids))
+
+            elapsed = time.perf_counter() - start
+            if added:
+                self._bump_rules_version()
+            self._remove_checkpoint(checkpoint_path)
+            logger.info(
+                "Added %d rule fragments in %.1fs (%.1f fragments/sec)",
+                added, elapsed, added / elapsed if elapsed else 0.0)
 
         except Exception as e:
             logger.error("Failed to batch add rule fragments: %s", str(e))
             raise
 
+    def _embed_chunk(self, chunk: List[RuleFragment]) -> Tuple[
+            List[str], List[str], List[Dict[str, Any]], List[List[float]]]:
+        """Prepare a chunk of fragments for the vector store."""
+        ids, texts, metadatas = [], [], []
+        for fragment in chunk:
+            chroma_dict = fragment.to_chroma_dict()
+            texts.append(chroma_dict["content"])
+            metadatas.append(chroma_dict["metadata"])
+            ids.append(chroma_dict["paragraph"])
+        return ids, texts, metadatas, self.embeddings.embed_documents(texts)
+
+    def _ingestion_fingerprint(self, fragments: List[RuleFragment],
+                               chunk_size: int) -> str:
+        """Identify an ingestion run, a checkpoint is only valid for the same one."""
+        digest = hashlib.sha256(
+            f"{self._embedding_model_name}:{chunk_size}".encode('utf-8'))
+        for fragment in fragments:
+            digest.update(fragment.content_hash().encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _load_checkpoint(path: Optional[str], fingerprint: str) -> int:
+        """Number of chunks already written by an interrupted identical run."""
+        if not path or not Path(path).exists():
+            return 0
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("fingerprint") != fingerprint:
+            logger.info("Ignoring checkpoint %s of a different ingestion", path)
+            return 0
+        return checkpoint["committed_chunks"]
+
+    @staticmethod
+    def _save_checkpoint(path: Optional[str], fingerprint: str,
+                         committed_chunks: int) -> None:
+        if not path:
+            return
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": fingerprint,
+                       "committed_chunks": committed_chunks}, f)
+
+    @staticmethod
+    def _remove_checkpoint(path: Optional[str]) -> None:
+        if path:
+            Path(path).unlink(missing_ok=True)
+
+    def build_artifact(
+            self,
+            fragments: Iterable[RuleFragment],
+            chunk_size: int = INGEST_CHUNK_SIZE) -> EmbeddingArtifact:
+        """Embed fragments into an artifact that can be ingested
+        or served later without running the embedding model."""
+        fragments = list(fragments)
+        ids, documents, metadatas, embeddings = [], [], [], []
+        for i in tqdm(range(0, len(fragments), chunk_size), unit="chunk"):
+            chunk_ids, texts, chunk_metadatas, chunk_embeddings = \
+                self._embed_chunk(fragments[i:i + chunk_size])
+            ids += chunk_ids
+            documents += texts
+            metadatas += chunk_metadatas
+            embeddings += chunk_embeddings
+        return EmbeddingArtifact(
+            model_name=self._embedding_model_name,
+            dimension=len(embeddings[0]) if embeddings else EMBEDDING_DIMENSION,
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=np.asarray(embeddings, dtype=np.float16),
+        )
+
+    def load_artifact(
+            self,
+            artifact: EmbeddingArtifact,
+            sync: bool = False,
+            chunk_size: int = INGEST_CHUNK_SIZE) -> None:
+        """Write precomputed fragments from an artifact to the vector store.
+        With `sync` only new or changed fragments are written
+        and fragments missing from the artifact are deleted."""
+        try:
+            rows = range(len(artifact))
+            vanished = []
+            if sync:
+                stored_hashes = self.get_stored_hashes()
+                rows = [row for row in rows
+                        if stored_hashes.get(artifact.ids[row])
+                        != artifact.metadatas[row].get("content_hash")]
+                artifact_ids = set(artifact.ids)
+                vanished = [id_ for id_ in stored_hashes
+                            if id_ not in artifact_ids]
+
+            rows = list(rows)
+            for i in tqdm(range(0, len(rows), chunk_size), unit="chunk"):
+                chunk = rows[i:i + chunk_size]
+                self.rules_collection.upsert(
+                    ids=[artifact.ids[row] for row in chunk],
+                    embeddings=artifact.embeddings[chunk].astype(np.float32).tolist(),
+                    metadatas=[artifact.metadatas[row] for row in chunk],
+                    documents=[artifact.documents[row] for row in chunk]
+                )
+            if rows:
+                self._bump_rules_version()
+            self.delete_rule_fragments(vanished)
+            logger.info("Loaded %d rule fragments from artifact", len(rows))
+
+        except Exception as e:
+            logger.error("Failed to load embedding artifact: %s", str(e))
+            raise
+
+    def get_stored_hashes(self) -> Dict[str, Optional[str]]:
+        """Get content hashes of stored fragments by their ids.
+        Fragments stored before hashing was introduced map to None."""
+        try:
+            stored = self.rules_collection.get(include=["metadatas"])
+            return {
+                id_: (metadata or {}).get("content_hash")
+                for id_, metadata in zip(stored["ids"], stored["metadatas"])
+            }
+        except Exception as e:
+            logger.error("Failed to get stored hashes: %s", str(e))
+            raise
+
+    def delete_rule_fragments(self, ids: List[str]) -> None:
+        """Delete rule fragments by their ids."""
+        try:
+            if ids:
+                self.rules_collection.delete(ids=ids)
+                self._bump_rules_version()
+                logger.info("Deleted %d rule fragments", len(ids))
+        except Exception as e:
+            logger.error("Failed to delete rule fragments: %s", str(e))
+            raise
+
+    def sync_rule_fragments(
+            self, fragments: List[RuleFragment]) -> Dict[str, int]:
+        """Incrementally bring the collection in line with `fragments`.
+
+        Only new or changed fragments (by content hash) are embedded and
+        upserted, fragments that are no longer present are deleted.
+        """
+        stored_hashes = self.get_stored_hashes()
+        new_ids = set()
+        changed = []
+        added = 0
+        for fragment in fragments:
+            new_ids.add(fragment.paragraph)
+            stored_hash = stored_hashes.get(fragment.paragraph)
+            if stored_hash != fragment.content_hash():
+                changed.append(fragment)
+                added += fragment.paragraph not in stored_hashes
+        vanished = [id_ for id_ in stored_hashes if id_ not in new_ids]
+
+        stats = {
+            "added": added,
+            "updated": len(changed) - added,
+            "deleted": len(vanished),
+            "unchanged": len(new_ids) - len(changed),
+        }
+        logger.info("Syncing rule fragments: %s", stats)
+        if changed:
+            self.batch_add_rule_fragments(changed)
+        self.delete_rule_fragments(vanished)
+        return stats
+
     def get_collection_stats(self) -> Dict[str, int]:
         """Get statistics about the collections."""
         try:
-            rules_count = self.rules_vectorstore._collection.count()
+            rules_count = self.rules_collection.count()
 
             return {
                 "rule_fragments": rules_count,
@@ -139,14 +922,21 @@ class RAGInterface:
     def clear_rules_collection(self) -> None:
         """Clear only the rule fragments collection."""
         try:
-            rule_ids = self.rules_vectorstore._collection.get()["ids"]
+            rule_ids = self.rules_collection.get()["ids"]
             if rule_ids:
-                self.rules_vectorstore._collection.delete(ids=rule_ids)
+                self.rules_collection.delete(ids=rule_ids)
+                self._bump_rules_version()
                 logger.info("Cleared rule fragments collection")
         except Exception as e:
             logger.error("Failed to clear rules collection: %s", str(e))
             raise
 
+    @staticmethod
+    def _relevance_score(distance: float) -> float:
+        """Squared L2 distance between unit vectors -> relevance score,
+        same as langchain's Chroma does for the default "l2" space."""
+        return 1.0 - distance / math.sqrt(2)
+
     @staticmethod
     def process_fragment(fragment: Dict[str, Any]) -> str:
         """Format fragment for display."""
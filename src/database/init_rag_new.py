@@ -3,10 +3,13 @@ import logging
 import sys
 
 import fire
+from document_sources import (default_sources, discover_sources,
+                              load_fragments)
+from embedding_artifact import EmbeddingArtifact
 from fragments_db import RAGInterface
-from text_processor import load_txt_fragments, split_into_fragments
 
-from consts import DATA_COMMENTS, DATA_RULES
+from consts import (DATA_COMMENTS, DATA_RULES, EMBEDDING_DIMENSION,
+                    EMBEDDING_MODEL_NAME, INGEST_SOURCES)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,40 +19,63 @@ logger = logging.getLogger(__name__)
 
 def fill_rule_fragments_collection(
         pdf_rules_path: str = DATA_RULES,
-        txt_comments_path: str = DATA_COMMENTS):
+        txt_comments_path: str = DATA_COMMENTS,
+        sync: bool = False,
+        artifact_path: str | None = None,
+        sources: str | None = INGEST_SOURCES):
+    """Fill the rule fragments collection.
+    With `sources` (a manifest or a directory, see document_sources.py)
+    all listed documents are ingested instead of the two paths.
+    With `sync` the existing collection is updated incrementally:
+    only new or changed fragments are embedded, vanished ones are deleted.
+    With `artifact_path` fragments and embeddings are taken from a prebuilt
+    artifact (see build_artifact.py) and the embedding model is not run."""
     rag = RAGInterface()
 
     # Check if 'rule_fragments' collection exists
-    try:
-        collection_stats = rag.get_collection_stats()
-        existing_rules_count = collection_stats.get("rule_fragments", 0)
-        if existing_rules_count > 0:
-            logger.info(
-                "rule_fragments collection is not empty. Collection stats: %s. Exiting.", collection_stats)
-            sys.exit(0)
-        else:
+    if not sync:
+        try:
+            collection_stats = rag.get_collection_stats()
+            existing_rules_count = collection_stats.get("rule_fragments", 0)
+            if existing_rules_count > 0:
+                logger.info(
+                    "rule_fragments collection is not empty. Collection stats: %s. "
+                    "Exiting, use --sync to update it incrementally.", collection_stats)
+                sys.exit(0)
+            else:
+                logger.info(
+                    "rule_fragments collection exists but is empty or new. Filling...")
+
+        except Exception:
             logger.info(
-                "rule_fragments collection exists but is empty or new. Filling...")
+                "rule_fragments collection does not exist. Creating and filling...")
 
-    except Exception:
-        logger.info(
-            "rule_fragments collection does not exist. Creating and filling...")
+    if artifact_path:
+        artifact = EmbeddingArtifact.load(
+            artifact_path,
+            model_name=EMBEDDING_MODEL_NAME,
+            dimension=EMBEDDING_DIMENSION)
+        rag.load_artifact(artifact, sync=sync)
+        logger.info("Database filling from artifact completed.")
+        return
 
-    # Parse PDF
-    pdf_fragments = split_into_fragments(data_path=pdf_rules_path)
-    # Parse TXT
-    txt_fragments = load_txt_fragments(
-        txt_comments_path,
-        paragraph="Комментарий СК ФСМ")
-    # Combine
-    all_fragments = pdf_fragments + txt_fragments
+    # Parse documents, unchanged ones are taken from the fragment cache
+    documents = (discover_sources(sources) if sources
+                 else default_sources(pdf_rules_path, txt_comments_path))
+    all_fragments = load_fragments(documents)
     logger.info(
         "Total fragments to add: %s", len(all_fragments))
     logger.info("Example fragment: %s", all_fragments[0])
 
     # Add fragments to DB
-    rag.batch_add_rule_fragments(all_fragments)
-    logger.info("Database filling completed.")
+    if sync:
+        # Changed fragments must be embedded like the ones already stored
+        rag.check_embedding_compatibility()
+        stats = rag.sync_rule_fragments(all_fragments)
+        logger.info("Database sync completed: %s", stats)
+    else:
+        rag.batch_add_rule_fragments(all_fragments)
+        logger.info("Database filling completed.")
 
 
 if __name__ == "__main__":
@@ -59,6 +85,11 @@ if __name__ == "__main__":
     --pdf_rules_path=data/official_rules_fsm.pdf \
     --txt_comments_path=data/fsm_comments.txt
     ```
+    Add `--sync` to re-embed only new or changed fragments
+    of an already filled collection, and `--artifact_path=data/embedding_artifact`
+    to ingest precomputed embeddings instead of running the model.
+    Use `--sources=data/sources` to ingest every document of a directory
+    or a manifest.
     """
     logger.info("Entering script...")
     fire.Fire(fill_rule_fragments_collection)
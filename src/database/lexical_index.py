@@ -0,0 +1,184 @@
+"""In-process BM25 index over rule fragments."""
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+POSTINGS_FILE = "postings.npz"
+META_FILE = "lexical.json"
+
+_TOKEN = re.compile(r'\w+')
+# Longest endings first, so "голосования" loses "ания", not just "я"
+_ENDINGS = sorted([
+    'ание', 'ания', 'анию', 'анием', 'ение', 'ения', 'ению', 'ением',
+    'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ий', 'ый', 'ой', 'ей', 'ым', 'им',
+    'ом', 'ем', 'ах', 'ях', 'ую', 'юю', 'ов', 'ев', 'ия', 'ья', 'ию', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+_STOPWORDS = frozenset([
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то',
+    'все', 'она', 'так', 'его', 'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за',
+    'бы', 'по', 'ее', 'мне', 'было', 'вот', 'от', 'меня', 'еще', 'нет', 'о',
+    'из', 'ему', 'ли', 'если', 'или', 'ни', 'быть', 'был', 'до', 'вас',
+    'уже', 'для', 'при', 'это', 'этом', 'кто', 'где', 'когда', 'какой',
+    'ведь', 'там', 'тот', 'чем', 'этот', 'того', 'потому', 'этого',
+])
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split into words and strip common Russian endings.
+    E.g. 'Голосования за фолы' -> ['голосов', 'фол']
+    """
+    tokens = []
+    for token in _TOKEN.findall(text.lower().replace('ё', 'е')):
+        if token in _STOPWORDS:
+            continue
+        for ending in _ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= 3:
+                token = token[:-len(ending)]
+                break
+        tokens.append(token)
+    return tokens
+
+
+class LexicalIndex:
+    """BM25 index with CSR-style postings kept in NumPy arrays.
+
+    `offsets[t]:offsets[t + 1]` slices `doc_ids` / `term_freqs`
+    for the term with id `t`, so the index is a handful of flat arrays.
+    Only fragment ids are kept, hits are served from the fragment store.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.ids: List[str] = []
+        self.rules_version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str],
+              metadatas: List[Dict[str, Any]],
+              rules_version: Optional[str] = None) -> "LexicalIndex":
+        """Index fragment contents together with their hierarchy headings."""
+        index = cls()
+        index.ids = ids
+        index.rules_version = rules_version
+
+        postings: Dict[int, Dict[int, int]] = {}
+        doc_lengths = []
+        for doc_id, (document, metadata) in enumerate(zip(documents, metadatas)):
+            tokens = tokenize(
+                f"{(metadata or {}).get('full_path', '')} {document}")
+            doc_lengths.append(len(tokens))
+            for token in tokens:
+                term_id = index.vocabulary.setdefault(token, len(index.vocabulary))
+                term_postings = postings.setdefault(term_id, {})
+                term_postings[doc_id] = term_postings.get(doc_id, 0) + 1
+
+        n_terms = len(index.vocabulary)
+        lengths = np.array([len(postings[t]) for t in range(n_terms)],
+                           dtype=np.int64)
+        index.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        index.doc_ids = np.fromiter(
+            (d for t in range(n_terms) for d in postings[t]),
+            dtype=np.int32, count=int(index.offsets[-1]))
+        index.term_freqs = np.fromiter(
+            (f for t in range(n_terms) for f in postings[t].values()),
+            dtype=np.float32, count=int(index.offsets[-1]))
+        index.doc_lengths = np.array(doc_lengths, dtype=np.float32)
+        n_docs = len(ids)
+        index.idf = np.log(
+            1 + (n_docs - lengths + 0.5) / (lengths + 0.5)).astype(np.float32)
+        logger.info("Built lexical index: %d fragments, %d terms",
+                    n_docs, n_terms)
+        return index
+
+    def _query_terms(self, query: str) -> List[int]:
+        return list(dict.fromkeys(
+            self.vocabulary[token] for token in tokenize(query)
+            if token in self.vocabulary))
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float, float]]:
+        """Top `k` fragments for a query as (row, bm25 score, confidence).
+
+        Confidence is the score divided by the score of a fragment of average
+        length that contains every query word once: 1.0 means the whole query
+        matched, shorter fragments and repeated words score above 1.0.
+        """
+        if not len(self):
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        avg_length = float(self.doc_lengths.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / avg_length)
+        reference = 0.0
+        query_terms = self._query_terms(query)
+        for term_id in query_terms:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm[docs])
+            # tf = 1 at average length scores exactly idf
+            reference += float(self.idf[term_id])
+        # Unknown query words still count, as the rarest known word
+        reference += (len(set(tokenize(query))) - len(query_terms)) * float(
+            self.idf.max(initial=0.0))
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row]),
+                 float(scores[row]) / reference if reference else 0.0)
+                for row in top]
+
+    def save(self, path: str) -> None:
+        index_path = Path(path)
+        index_path.mkdir(parents=True, exist_ok=True)
+        np.savez(index_path / POSTINGS_FILE,
+                 offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_freqs=self.term_freqs, idf=self.idf,
+                 doc_lengths=self.doc_lengths)
+        with open(index_path / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "rules_version": self.rules_version,
+                "vocabulary": self.vocabulary,
+                "ids": self.ids,
+            }, f, ensure_ascii=False)
+        logger.info("Saved lexical index to %s", index_path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        index_path = Path(path)
+        with open(index_path / META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.rules_version = meta["rules_version"]
+        index.vocabulary = meta["vocabulary"]
+        index.ids = meta["ids"]
+        with np.load(index_path / POSTINGS_FILE) as arrays:
+            index.offsets = arrays["offsets"]
+            index.doc_ids = arrays["doc_ids"]
+            index.term_freqs = arrays["term_freqs"]
+            index.idf = arrays["idf"]
+            index.doc_lengths = arrays["doc_lengths"]
+        logger.info("Loaded lexical index with %d fragments from %s",
+                    len(index), index_path)
+        return index
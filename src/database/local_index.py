@@ -0,0 +1,289 @@
+"""In-process vector index over memory-mapped NumPy embeddings.
+
+Alternative to the Chroma HTTP backend for small corpora. Mirrors the subset
+of the chromadb `Collection` API used by `RAGInterface`, so both backends
+are interchangeable.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.json"
+# Name of the generation directory holding the current files
+CURRENT_FILE = "CURRENT"
+# Older generations are kept for a while, readers may still be opening them
+KEEP_GENERATIONS = 2
+
+
+class _Snapshot(NamedTuple):
+    """Files of one generation, replaced as a whole and never modified."""
+    generation: Optional[str]
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Dict[str, Any]]
+    id_to_row: Dict[str, int]
+    embeddings: Optional[np.ndarray]
+    collection_metadata: Dict[str, Any]
+
+
+_EMPTY = _Snapshot(None, [], [], [], {}, None, {})
+
+
+class LocalVectorIndex:
+    """Normalized fragment embeddings in a `.npy` memmap plus a JSON side file.
+
+    Search is a single matrix-vector product followed by `argpartition`.
+    Distances are squared L2 between unit vectors (`2 - 2 * cos`),
+    the same scale Chroma reports for its default "l2" space.
+
+    Every save writes both files into a new generation directory and then
+    atomically points `CURRENT` at it, so readers in this or another process
+    always see embeddings and metadata of the same generation. In memory the
+    generation is one immutable snapshot: searches take it once and are not
+    affected by a concurrent reload or write.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        # Guards reloads and writes, searches only read `self._snapshot`
+        self._lock = threading.RLock()
+        self._snapshot = _EMPTY
+        with self._lock:
+            self._reload_if_changed()
+        if self._snapshot.embeddings is None:
+            logger.info("Local index at %s is empty", self.path)
+
+    def _current_generation(self) -> Optional[str]:
+        """Generation on disk, "" for files written before generations."""
+        try:
+            return (self.path / CURRENT_FILE).read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            if (self.path / METADATA_FILE).exists():
+                return ""
+            return None
+
+    def _load(self, generation: str) -> None:
+        directory = self.path / generation
+        with open(directory / METADATA_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        ids = meta["ids"]
+        self._snapshot = _Snapshot(
+            generation=generation,
+            ids=ids,
+            documents=meta["documents"],
+            metadatas=meta["metadatas"],
+            id_to_row={id_: row for row, id_ in enumerate(ids)},
+            embeddings=np.load(directory / EMBEDDINGS_FILE, mmap_mode='r'),
+            collection_metadata=meta.get("collection_metadata", {}))
+        logger.info("Loaded local index with %d fragments from %s",
+                    len(ids), directory)
+
+    def _reload_if_changed(self) -> _Snapshot:
+        """Pick up a generation written by another process, e.g. re-ingestion.
+        Returns the snapshot to read from."""
+        snapshot = self._snapshot
+        generation = self._current_generation()
+        if generation is None or generation == snapshot.generation:
+            return snapshot
+        with self._lock:
+            if self._current_generation() != self._snapshot.generation:
+                self._load(self._current_generation())
+            return self._snapshot
+
+    def _save(self, ids: List[str], documents: List[str],
+              metadatas: List[Dict[str, Any]], embeddings: np.ndarray,
+              collection_metadata: Dict[str, Any]) -> None:
+        """Write a new generation, switch `CURRENT` to it and reopen the memmap.
+        Must be called with the lock held."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        previous = self._current_generation()
+        number = int(previous.split('-')[-1]) + 1 if previous else 1
+        generation = f"gen-{number:06d}"
+        directory = self.path / generation
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir()
+
+        with open(directory / EMBEDDINGS_FILE, 'wb') as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+        with open(directory / METADATA_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                "ids": ids,
+                "documents": documents,
+                "metadatas": metadatas,
+                "collection_metadata": collection_metadata,
+            }, f, ensure_ascii=False)
+
+        current_tmp = self.path / (CURRENT_FILE + ".tmp")
+        current_tmp.write_text(generation, encoding='utf-8')
+        os.replace(current_tmp, self.path / CURRENT_FILE)
+        self._load(generation)
+        self._remove_old_generations(number)
+
+    def _remove_old_generations(self, current: int) -> None:
+        for file_name in (EMBEDDINGS_FILE, METADATA_FILE):
+            # Files of the layout without generations
+            (self.path / file_name).unlink(missing_ok=True)
+        for directory in self.path.glob("gen-*"):
+            try:
+                number = int(directory.name.split('-')[-1])
+            except ValueError:
+                continue
+            if number <= current - KEEP_GENERATIONS:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    def _normalize(vectors: Any) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Collection-level metadata, as `Collection.metadata` in Chroma."""
+        return self._reload_if_changed().collection_metadata
+
+    def count(self) -> int:
+        return len(self._reload_if_changed().ids)
+
+    def modify(self, metadata: Dict[str, Any]) -> None:
+        """Replace collection-level metadata."""
+        with self._lock:
+            snapshot = self._reload_if_changed()
+            vectors = (np.array(snapshot.embeddings, dtype=np.float32)
+                       if snapshot.embeddings is not None
+                       else np.empty((0, 0), dtype=np.float32))
+            self._save(snapshot.ids, snapshot.documents, snapshot.metadatas,
+                       vectors, dict(metadata))
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        documents: List[str]
+    ) -> None:
+        """Insert new fragments or overwrite existing ones with the same id."""
+        new_vectors = self._normalize(embeddings)
+        with self._lock:
+            snapshot = self._reload_if_changed()
+            if snapshot.embeddings is not None and snapshot.ids:
+                all_vectors = np.array(snapshot.embeddings, dtype=np.float32)
+            else:
+                all_vectors = np.empty(
+                    (0, new_vectors.shape[1]), dtype=np.float32)
+            if all_vectors.shape[1] != new_vectors.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {new_vectors.shape[1]} does not match "
+                    f"index dimension {all_vectors.shape[1]}")
+
+            # Copies: the current snapshot may be read by searches meanwhile
+            all_ids = list(snapshot.ids)
+            all_documents = list(snapshot.documents)
+            all_metadatas = list(snapshot.metadatas)
+            id_to_row = dict(snapshot.id_to_row)
+            appended = []
+            for id_, vector, metadata, document in zip(
+                    ids, new_vectors, metadatas, documents):
+                row = id_to_row.get(id_)
+                if row is None:
+                    id_to_row[id_] = len(all_ids)
+                    all_ids.append(id_)
+                    all_documents.append(document)
+                    all_metadatas.append(metadata)
+                    appended.append(vector)
+                else:
+                    all_vectors[row] = vector
+                    all_documents[row] = document
+                    all_metadatas[row] = metadata
+
+            if appended:
+                all_vectors = np.vstack([all_vectors, np.stack(appended)])
+            self._save(all_ids, all_documents, all_metadatas, all_vectors,
+                       snapshot.collection_metadata)
+
+    def delete(self, ids: List[str]) -> None:
+        """Delete fragments by id, unknown ids are ignored."""
+        with self._lock:
+            snapshot = self._reload_if_changed()
+            drop = {snapshot.id_to_row[id_] for id_ in ids
+                    if id_ in snapshot.id_to_row}
+            if not drop:
+                return
+            keep = [row for row in range(len(snapshot.ids)) if row not in drop]
+            vectors = np.array(snapshot.embeddings, dtype=np.float32)[keep]
+            self._save([snapshot.ids[row] for row in keep],
+                       [snapshot.documents[row] for row in keep],
+                       [snapshot.metadatas[row] for row in keep],
+                       vectors, snapshot.collection_metadata)
+
+    def get(self, ids: Optional[List[str]] = None,
+            limit: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """Get stored fragments, all of them if `ids` is None.
+        Documents and metadatas are always returned,
+        embeddings only if listed in `include`, as in Chroma.
+        """
+        snapshot = self._reload_if_changed()
+        if ids is None:
+            rows = list(range(len(snapshot.ids)))
+        else:
+            rows = [snapshot.id_to_row[id_] for id_ in ids
+                    if id_ in snapshot.id_to_row]
+        if limit is not None:
+            rows = rows[:limit]
+        result = {
+            "ids": [snapshot.ids[row] for row in rows],
+            "documents": [snapshot.documents[row] for row in rows],
+            "metadatas": [snapshot.metadatas[row] for row in rows],
+        }
+        if include and "embeddings" in include:
+            result["embeddings"] = [snapshot.embeddings[row].tolist()
+                                    for row in rows]
+        return result
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 3,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, List[List[Any]]]:
+        """Exact nearest neighbours for each query embedding.
+        Ids are always returned, other fields only if listed in `include`,
+        by default documents, metadatas and distances, as in Chroma."""
+        include = include or ["documents", "metadatas", "distances"]
+        snapshot = self._reload_if_changed()
+        result = {"ids": []}
+        result.update({key: [] for key in include
+                       if key in ("documents", "metadatas", "distances")})
+        if not snapshot.ids:
+            for key in result:
+                result[key] = [[] for _ in query_embeddings]
+            return result
+
+        queries = self._normalize(query_embeddings)
+        scores = queries @ snapshot.embeddings.T  # (n_queries, n_fragments)
+        k = min(n_results, len(snapshot.ids))
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            result["ids"].append([snapshot.ids[row] for row in top])
+            if "documents" in result:
+                result["documents"].append([snapshot.documents[row] for row in top])
+            if "metadatas" in result:
+                result["metadatas"].append([snapshot.metadatas[row] for row in top])
+            if "distances" in result:
+                result["distances"].append(
+                    [float(2.0 - 2.0 * row_scores[row]) for row in top])
+        return result
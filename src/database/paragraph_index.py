@@ -0,0 +1,104 @@
+"""Index of rule fragments by paragraph number.
+
+Paragraphs of prefixed documents are found by their prefix, e.g.
+"покажи ЮФО 4.3" or "что в ЮФО 4", bare numbers refer to the
+unprefixed document.
+"""
+import bisect
+import re
+from typing import Any, Dict, List, Optional
+
+from database.fragment_store import FragmentStore, split_paragraph
+
+# "6.1.2", "6.1.2." or "4.3"; single numbers only after an explicit word,
+# e.g. "пункт 6" or "пункты 6, 7 и 9", so that "игрок 6" is not taken
+# for a paragraph
+_MULTI_LEVEL = re.compile(r'(?<!\d)(?<!\d\.)(\d+(?:\.\d+)+)\.?(?!\d)')
+_SINGLE_NUMBER = r'\d+\.?(?![\d.])'
+_SINGLE_LEVEL = re.compile(
+    rf'(?:пункт\w*|раздел\w*|глав\w*|п\.)\s*({_SINGLE_NUMBER}'
+    rf'(?:(?:\s*,\s*|\s+(?:и|или)\s+){_SINGLE_NUMBER})*)', re.IGNORECASE)
+_NUMBER = re.compile(r'\d+')
+_WORD = re.compile(r'\w+')
+# Words that make up "what does paragraph X say"-like requests,
+# punctuation between them is ignored: "покажи 4.3, 4.4 и 4.5"
+_LOOKUP_WORDS = frozenset([
+    'и', 'а', 'или', 'также', 'еще', 'пунктов', 'пунктам', 'разделы',
+    'что', 'в', 'во', 'о', 'об', 'про', 'чем', 'там', 'п', 'пункт', 'пункте',
+    'пункта', 'пункты', 'пунктах', 'раздел', 'разделе', 'раздела', 'глава',
+    'главе', 'главы', 'правило', 'правила', 'правилах', 'текст', 'покажи',
+    'показать', 'напиши', 'выведи', 'процитируй', 'написано', 'сказано',
+    'говорится', 'гласит', 'значит', 'содержит', 'фсм', 'мне', 'пожалуйста',
+])
+
+
+class ParagraphIndex:
+    """Rule fragments looked up by paragraph number, with their subtrees."""
+
+    def __init__(self, store: FragmentStore):
+        self._store = store
+        # Rows of numbered paragraphs in document order, for subtree range lookups
+        numbered = [store[row] for row in range(len(store))
+                    if store[row].order[0] == 0]
+        numbered.sort(key=lambda fragment: fragment.order)
+        self._sorted = [fragment.row for fragment in numbered]
+        # (prefix, numbers) of each row
+        self._sorted_keys = [fragment.order[1:] for fragment in numbered]
+        # A known document prefix works like "пункт": "ЮФО 6" is a paragraph
+        self._prefixes = {fragment.prefix.strip().lower(): fragment.prefix
+                          for fragment in numbered if fragment.prefix}
+        self._prefixed = re.compile(
+            r'(?<!\w)(' + '|'.join(
+                re.escape(prefix) for prefix in sorted(
+                    self._prefixes, key=len, reverse=True))
+            + r')\s*(\d+(?:\.\d+)*)\.?(?![\d.])',
+            re.IGNORECASE) if self._prefixes else None
+
+    def __contains__(self, paragraph: str) -> bool:
+        return self._store.row(paragraph) is not None
+
+    def get(self, paragraph: str) -> Optional[Dict[str, Any]]:
+        """Fragment of a paragraph in the search results format."""
+        row = self._store.row(paragraph)
+        return None if row is None else self._store.result(row, 1.0)
+
+    def subtree(self, paragraph: str) -> List[Dict[str, Any]]:
+        """Fragments of a paragraph and all its subparagraphs in order.
+        E.g. "4.3" -> 4.3, 4.3.1, 4.3.2, ...,
+        "ЮФО 4" -> ЮФО 4, ЮФО 4.1, ..."""
+        key = split_paragraph(paragraph)
+        if key is None:
+            return []
+        prefix, numbers = key
+        start = bisect.bisect_left(self._sorted_keys, key)
+        end = start
+        while (end < len(self._sorted_keys)
+               and self._sorted_keys[end][0] == prefix
+               and self._sorted_keys[end][1][:len(numbers)] == numbers):
+            end += 1
+        return [self._store.result(row, 1.0) for row in self._sorted[start:end]]
+
+    def find_references(self, query: str) -> List[str]:
+        """Known paragraph ids mentioned in a query, in order of mention."""
+        found = []
+        if self._prefixed is not None:
+            found += [self._prefixes[match.group(1).lower()] + match.group(2)
+                      for match in self._prefixed.finditer(query)]
+            query = self._prefixed.sub(' ', query)
+        found += [match.group(1) for match in _MULTI_LEVEL.finditer(query)]
+        found += [number for match in _SINGLE_LEVEL.finditer(query)
+                  for number in _NUMBER.findall(match.group(1))]
+        return [paragraph for paragraph in dict.fromkeys(found)
+                if paragraph in self or self.subtree(paragraph)]
+
+    def is_direct_lookup(self, query: str) -> bool:
+        """Whether a query only asks to show paragraphs, e.g. "что в пункте 6.1.2".
+        Such queries are answered with the paragraph text, without the LLM."""
+        if not self.find_references(query):
+            return False
+        rest = query
+        if self._prefixed is not None:
+            rest = self._prefixed.sub(' ', rest)
+        rest = _SINGLE_LEVEL.sub(' ', _MULTI_LEVEL.sub(' ', rest))
+        return all(word in _LOOKUP_WORDS
+                   for word in _WORD.findall(rest.lower().replace('ё', 'е')))
@@ -1,4 +1,6 @@
 """Model for a fragment of a rule."""
+import hashlib
+import json
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
@@ -23,6 +25,16 @@ class RuleFragment(BaseModel):
     embedding: Optional[List[float]]
     fragment_id: str = Field(default_factory=lambda: str(uuid4()))
 
+    def content_hash(self) -> str:
+        """Hash of everything that ends up in the vector store,
+        used to detect changed fragments on re-ingestion."""
+        payload = json.dumps({
+            "paragraph": self.paragraph,
+            "content": self.content,
+            "hierarchy": [level.heading_text for level in self.hierarchy],
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
     def to_chroma_dict(self) -> Dict[str, Any]:
         """Convert to a dictionary for storage in the vector store."""
         return {
@@ -31,7 +43,8 @@ class RuleFragment(BaseModel):
             "hierarchy": [level.model_dump_json() for level in self.hierarchy],
             "metadata": {
                 "paragraph": self.paragraph,
-                "full_path": " > ".join(level.heading_text for level in self.hierarchy)
+                "full_path": " > ".join(level.heading_text for level in self.hierarchy),
+                "content_hash": self.content_hash()
             }
         }
 
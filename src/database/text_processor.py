@@ -1,8 +1,9 @@
 """Module for processing text data from PDF and txt files."""
+import hashlib
 import logging
 import re
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List
 
 import PyPDF2
 
@@ -12,6 +13,44 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def iter_page_lines(page_texts: Iterable[str]) -> Iterator[str]:
+    """Non-empty stripped lines of consecutive page texts.
+    Pages are glued without a separator, so a line split by a page break
+    is yielded once, same as for the concatenated document text."""
+    tail = ''
+    for page_text in page_texts:
+        *complete, tail = (tail + page_text).split('\n')
+        for line in complete:
+            if line.strip():
+                yield line.strip()
+    if tail.strip():
+        yield tail.strip()
+
+
+def iter_pdf_lines(data_path: str) -> Iterator[str]:
+    """Stream non-empty stripped lines of a PDF file page by page."""
+    logger.info("Reading PDF file from: %s", data_path)
+    pdf_path = Path(data_path)
+
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        yield from iter_page_lines(
+            page.extract_text() for page in pdf_reader.pages)
+
+
+def count_pdf_pages(data_path: str) -> int:
+    with open(data_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_page_texts(data_path: str, start: int, stop: int) -> List[str]:
+    """Text of pages `start:stop` of a PDF file.
+    A top-level function, so it can run in a process pool."""
+    with open(data_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+
 def extract_pdf_text(data_path: str) -> str:
     """Extract text content from PDF file."""
     logger.info("Reading PDF file from: %s", data_path)
@@ -19,89 +58,97 @@ def extract_pdf_text(data_path: str) -> str:
 
     with open(pdf_path, 'rb') as file:
         pdf_reader = PyPDF2.PdfReader(file)
-        text = ''
-        for page in pdf_reader.pages:
-            text += page.extract_text()
+        text = ''.join(page.extract_text() for page in pdf_reader.pages)
 
     logger.info("Successfully extracted %d characters from PDF", len(text))
     return text
 
 
-def parse_hierarchy(paragraph_num: str, lines: List[str]) -> List[RuleLevel]:
-    """Parse hierarchy levels from paragraph number and corresponding lines."""
+def add_heading(heading_index: Dict[str, str], paragraph_num: str,
+                line: str) -> None:
+    """Register `line` as the heading of every level of `paragraph_num`
+    that has no heading yet, i.e. the first line starting with that number."""
+    parts = paragraph_num.split('.')
+    for i in range(len(parts)):
+        heading_index.setdefault('.'.join(parts[:i+1]), line)
+
+
+def parse_hierarchy(paragraph_num: str,
+                    heading_index: Dict[str, str]) -> List[RuleLevel]:
+    """Parse hierarchy levels of a paragraph from the heading index."""
     parts = paragraph_num.split('.')
     hierarchy = []
 
     for i in range(len(parts)):
         current_num = '.'.join(parts[:i+1])
-        # Find matching line for current level
-        for line in lines:
-            if line.startswith(current_num + '.'):
-                title = line[len(current_num + '. '):].strip()
-                hierarchy.append(RuleLevel(
-                    title=title,
-                    paragraph_number=current_num,
-                    heading_text=f"{current_num}. {title}"
-                ))
-                break
+        line = heading_index.get(current_num)
+        if line is not None:
+            title = line[len(current_num + '. '):].strip()
+            hierarchy.append(RuleLevel(
+                title=title,
+                paragraph_number=current_num,
+                heading_text=f"{current_num}. {title}"
+            ))
 
     return hierarchy[:-1]  # Exclude current level from hierarchy
 
 
-def split_into_fragments(data_path: str) -> List[RuleFragment]:
-    """Split PDF content into rule fragments."""
+def split_into_fragments(data_path: str) -> Iterator[RuleFragment]:
+    """Split PDF content into rule fragments, streaming them one by one."""
     logger.info("Starting to process document from: %s", data_path)
+    return split_lines_into_fragments(iter_pdf_lines(data_path))
+
 
-    text = extract_pdf_text(data_path)
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+def split_lines_into_fragments(lines: Iterable[str],
+                               prefix: str = "") -> Iterator[RuleFragment]:
+    """Split document lines into rule fragments, streaming them one by one.
+
+    Headings are indexed in the same single pass over the lines,
+    so resolving a hierarchy is a dictionary lookup per level.
+    `prefix` is prepended to paragraph ids, e.g. "ЮФО " -> "ЮФО 1.1",
+    to keep paragraphs of several documents apart.
+    """
 
     # Regular expression for paragraph numbers (e.g., "4.1.2.")
-    paragraph_pattern = r'^\d+(?:\.\d+)*\.'
+    paragraph_pattern = re.compile(r'^\d+(?:\.\d+)*\.')
 
-    fragments = []
+    heading_index: Dict[str, str] = {}
     current_paragraph = None
     current_content = []
+    fragments_count = 0
+
+    def make_fragment() -> RuleFragment:
+        paragraph_num = current_paragraph.rstrip('.')
+        logger.debug("Created fragment for paragraph %s", paragraph_num)
+        return RuleFragment(
+            content=' '.join(current_content),
+            paragraph=f"{prefix}{paragraph_num}",
+            hierarchy=parse_hierarchy(paragraph_num, heading_index),
+            embedding=None
+        )
 
     for line in lines:
-        match = re.match(paragraph_pattern, line)
+        match = paragraph_pattern.match(line)
 
         if match:
             # Save previous fragment if exists
             if current_paragraph and current_content:
-                paragraph_num = current_paragraph.rstrip('.')
-                hierarchy = parse_hierarchy(paragraph_num, lines)
-                content = ' '.join(current_content)
-
-                fragment = RuleFragment(
-                    content=content,
-                    paragraph=paragraph_num,
-                    hierarchy=hierarchy,
-                    embedding=None
-                )
-                fragments.append(fragment)
-                logger.debug(
-                    "Created fragment for paragraph %s", paragraph_num)
+                yield make_fragment()
+                fragments_count += 1
 
             current_paragraph = match.group(0)
             current_content = [line[len(current_paragraph):].strip()]
+            add_heading(heading_index, current_paragraph.rstrip('.'), line)
         else:
             if current_paragraph:  # Append to current paragraph content
                 current_content.append(line)
 
     # Add last fragment
     if current_paragraph and current_content:
-        paragraph_num = current_paragraph.rstrip('.')
-        hierarchy = parse_hierarchy(paragraph_num, lines)
-        fragment = RuleFragment(
-            content=' '.join(current_content),
-            paragraph=paragraph_num,
-            hierarchy=hierarchy,
-            embedding=None
-        )
-        fragments.append(fragment)
+        yield make_fragment()
+        fragments_count += 1
 
-    logger.info("Successfully split document into %d fragments", len(fragments))
-    return fragments
+    logger.info("Successfully split document into %d fragments", fragments_count)
 
 
 def load_txt_fragments(file_path: str, paragraph: str) -> List[RuleFragment]:
@@ -118,13 +165,17 @@ def load_txt_fragments(file_path: str, paragraph: str) -> List[RuleFragment]:
     High level heading 3
     ...
     ```
+    Ids are `"{paragraph} #{hash of the heading and statement}"`: adding or
+    removing a comment doesn't change the ids of the others, so
+    re-ingestion only embeds the comments that actually changed.
+    The "#" keeps an all-digit hash from reading as a paragraph number.
     """
     fragments = []
     with open(file_path, 'r', encoding='utf-8') as f:
         lines = [line.strip('\n') for line in f.readlines()]
 
     current_heading = None
-    i = 10
+    seen: Dict[str, int] = {}
     for line in lines:
         line = line.strip()
         if not current_heading and line:
@@ -134,10 +185,16 @@ def load_txt_fragments(file_path: str, paragraph: str) -> List[RuleFragment]:
             current_heading = None
             continue
         if current_heading:
+            content = f"{current_heading}\n{line}"
+            comment_id = hashlib.sha256(content.encode('utf-8')).hexdigest()[:8]
+            # A repeated comment gets the number of its repetition
+            seen[comment_id] = seen.get(comment_id, 0) + 1
+            if seen[comment_id] > 1:
+                comment_id = f"{comment_id}-{seen[comment_id]}"
             fragments.append(
                 RuleFragment(
-                    content=f"{current_heading}\n{line}",
-                    paragraph=f"{paragraph} {i}",
+                    content=content,
+                    paragraph=f"{paragraph} #{comment_id}",
                     hierarchy=[RuleLevel(
                         title="",
                         paragraph_number="-",
@@ -146,5 +203,4 @@ def load_txt_fragments(file_path: str, paragraph: str) -> List[RuleFragment]:
                     embedding=None
                 )
             )
-            i += 1
     return fragments
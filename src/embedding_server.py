@@ -0,0 +1,111 @@
+"""Standalone embedding server shared by several bot processes.
+
+Owns the only copy of the embedding model; bots use it through the
+"remote" embedding backend. Small requests (single questions) from all
+clients are merged into batched forward passes by `QueryEmbeddingBatcher`,
+larger ones (ingestion chunks) are encoded as they come.
+
+API:
+- `POST /embed` `{"texts": [...]}` -> `{"model", "backend", "embeddings"}`
+- `GET /health` -> `{"status", "model", "backend"}`
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import fire
+from aiohttp import web
+
+from consts import (EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_WAIT_MS,
+                    EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_PATH,
+                    EMBEDDING_ONNX_QUANTIZATION, EMBEDDING_SERVER_BACKEND,
+                    EMBEDDING_SERVER_HOST, EMBEDDING_SERVER_PORT,
+                    EMBEDDING_SERVER_SOCKET, RAG_EXECUTOR_WORKERS)
+from database.embedding_backends import load_embeddings
+from database.fragments_db import QueryEmbeddingBatcher
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def create_app(backend: str = EMBEDDING_SERVER_BACKEND,
+               model_name: str = EMBEDDING_MODEL_NAME,
+               workers: int = RAG_EXECUTOR_WORKERS,
+               max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE,
+               max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS) -> web.Application:
+    """Load the model and build the server app."""
+    if backend == "remote":
+        raise ValueError("The embedding server needs a local backend")
+    embeddings = load_embeddings(
+        backend, model_name,
+        onnx_quantization=EMBEDDING_ONNX_QUANTIZATION,
+        onnx_path=EMBEDDING_ONNX_PATH)
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="embed")
+    batcher = QueryEmbeddingBatcher(
+        embed_batch=embeddings.embed_documents,
+        executor=executor,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms)
+
+    async def embed(request: web.Request) -> web.Response:
+        try:
+            texts = (await request.json())["texts"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='Expected JSON {"texts": [...]}')
+        if not isinstance(texts, list) or not all(
+                isinstance(text, str) for text in texts):
+            raise web.HTTPBadRequest(text='"texts" must be a list of strings')
+
+        if len(texts) <= max_batch_size:
+            vectors = await asyncio.gather(*(batcher.embed(text) for text in texts))
+        else:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                executor, embeddings.embed_documents, texts)
+        return web.json_response({
+            "model": model_name,
+            "backend": backend,
+            "embeddings": vectors,
+        })
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "model": model_name,
+            "backend": backend,
+        })
+
+    async def shutdown(app: web.Application) -> None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Ingestion chunks of long fragments exceed the default 1 MB body limit
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/embed", embed)
+    app.router.add_get("/health", health)
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def serve(host: str = EMBEDDING_SERVER_HOST,
+          port: int = EMBEDDING_SERVER_PORT,
+          socket_path: Optional[str] = EMBEDDING_SERVER_SOCKET,
+          backend: str = EMBEDDING_SERVER_BACKEND):
+    """Run the server on `host:port`, or on a Unix socket if `socket_path` is set."""
+    app = create_app(backend=backend)
+    if socket_path:
+        logger.info("Serving embeddings on unix socket %s", socket_path)
+        web.run_app(app, path=socket_path)
+    else:
+        web.run_app(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    """Example usage:
+    ```
+    python embedding_server.py --port=8080 --backend=onnx
+    ```
+    """
+    fire.Fire(serve)
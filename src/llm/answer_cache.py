@@ -0,0 +1,116 @@
+"""Semantic cache for LLM answers."""
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CachedAnswer:
+    vector: List[float]
+    context_key: FrozenSet[str]
+    answer: str
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class AnswerCache:
+    """Cache of LLM answers keyed by query embedding and retrieved context.
+
+    An answer is reused only when a new question retrieved exactly the same set
+    of rule fragments and its embedding is at least `similarity_threshold`
+    cosine-similar to the cached question. Entries expire after `ttl` seconds,
+    the least recently used ones are evicted above `max_size`, and the whole
+    cache is dropped when the rules collection version changes.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95,
+                 ttl: float = 24 * 60 * 60, max_size: int = 512):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, _CachedAnswer] = OrderedDict()
+        self._by_context: Dict[FrozenSet[str], List[int]] = {}
+        self._next_id = 0
+        self._rules_version: Optional[str] = None
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def sync_version(self, rules_version: Optional[str]) -> None:
+        """Invalidate all answers if the rules collection was re-ingested."""
+        if rules_version != self._rules_version:
+            if self._entries:
+                logger.info("Rules version changed to %s, clearing %d cached answers",
+                            rules_version, len(self._entries))
+            self.clear()
+            self._rules_version = rules_version
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_context.clear()
+
+    def get(self, vector: Optional[List[float]],
+            paragraph_ids: Iterable[str]) -> Optional[str]:
+        """Cached answer for a near-duplicate question with the same context.
+        Questions without an embedding (lexical search hits) are never cached."""
+        if self.max_size <= 0 or vector is None:
+            return None
+        context_key = frozenset(paragraph_ids)
+        now = time.monotonic()
+        best_id, best_similarity = None, self.similarity_threshold
+        for entry_id in list(self._by_context.get(context_key, ())):
+            entry = self._entries[entry_id]
+            if now - entry.created_at > self.ttl:
+                self._remove(entry_id)
+                continue
+            similarity = self._cosine(vector, entry.vector)
+            if similarity >= best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best_id)
+        logger.info("Answer cache hit (similarity %.3f)", best_similarity)
+        return self._entries[best_id].answer
+
+    def put(self, vector: Optional[List[float]], paragraph_ids: Iterable[str],
+            answer: str) -> None:
+        """Store an answer for a question and its retrieved context."""
+        if self.max_size <= 0 or vector is None:
+            return
+        context_key = frozenset(paragraph_ids)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _CachedAnswer(
+            vector=list(vector), context_key=context_key, answer=answer)
+        self._by_context.setdefault(context_key, []).append(entry_id)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        ids = self._by_context[entry.context_key]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_context[entry.context_key]
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
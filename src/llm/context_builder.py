@@ -0,0 +1,93 @@
+"""Assembly of retrieved rule fragments into a compact LLM context."""
+from typing import Any, Callable, Dict, List, Tuple
+
+from consts import CONTEXT_TOKEN_BUDGET
+from database.fragment_store import (PATH_SEPARATOR, StoredFragment,
+                                     stored_fragment)
+
+
+def _fragment_lines(fragment: StoredFragment, printed: Tuple[str, ...]) -> Tuple[
+        List[str], Tuple[str, ...]]:
+    """Lines of a fragment given the hierarchy levels already printed above it,
+    and the levels printed after it."""
+    keys = fragment.level_keys
+    common = 0
+    while (common < len(keys) and common < len(printed)
+           and keys[common] == printed[common]):
+        common += 1
+    lines = []
+    if fragment.levels[common:]:
+        lines.append(PATH_SEPARATOR.join(fragment.levels[common:]))
+    lines.append(fragment.line)
+    return lines, fragment.printed_keys
+
+
+def render_context(fragments: List[Dict[str, Any]]) -> str:
+    """Fragments in document order, each heading path printed once:
+    siblings share their parent headings, and children follow their
+    parent paragraph without repeating it."""
+    lines, printed = [], ()
+    for fragment in sorted(map(stored_fragment, fragments),
+                           key=lambda fragment: fragment.order):
+        fragment_lines, printed = _fragment_lines(fragment, printed)
+        lines += fragment_lines
+    return "\n".join(lines)
+
+
+def build_context(fragments: List[Dict[str, Any]],
+                  count_tokens: Callable[[str], int],
+                  token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  keep: int = 1
+                  ) -> Tuple[str, List[Dict[str, Any]], int]:
+    """Pack the most relevant fragments into at most `token_budget` tokens.
+
+    Every fragment line and heading is tokenized once and the counts are
+    summed, a heading shared by several fragments counts once, as it is
+    printed once. The total is an estimate: it ignores the separators
+    between headings and may count a heading that ends up not printed.
+
+    Parameters
+    ----------
+    fragments : list[dict]
+        Search results, most relevant first
+    count_tokens : Callable[[str], int]
+        Token counter of the answering model
+    token_budget : int, optional
+        Limit for the rendered context, by default CONTEXT_TOKEN_BUDGET
+    keep : int, optional
+        Number of leading fragments kept whatever the budget,
+        e.g. paragraphs cited by number, by default 1 (the best one)
+
+    Returns
+    -------
+    tuple[str, list[dict], int]
+        Context text, the fragments it contains, most relevant first,
+        and its estimated number of tokens
+    """
+    selected: List[Dict[str, Any]] = []
+    seen = set()
+    printed = set()
+    heading_tokens: Dict[str, int] = {}
+    total = 0
+    for position, fragment in enumerate(fragments):
+        paragraph = fragment['metadata']['paragraph']
+        if paragraph in seen:
+            continue
+        stored = stored_fragment(fragment)
+        new_levels = [(key, level) for key, level
+                      in zip(stored.level_keys, stored.levels)
+                      if key not in printed]
+        for _, level in new_levels:
+            if level not in heading_tokens:
+                heading_tokens[level] = count_tokens(level)
+        cost = count_tokens(stored.line) + sum(
+            heading_tokens[level] for _, level in new_levels)
+        if position >= keep and selected and total + cost > token_budget:
+            # A shorter, less relevant fragment may still fit
+            continue
+        selected.append(fragment)
+        seen.add(paragraph)
+        printed.update(key for key, _ in new_levels)
+        printed.update(stored.printed_keys)
+        total += cost
+    return render_context(selected), selected, total
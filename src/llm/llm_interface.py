@@ -1,14 +1,121 @@
 """LLM interface for calling models –
 compatible with OpenAI, Ollama and other LLMs."""
+import asyncio
 import json
 import logging
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
+import httpx
 import litellm
 
-from consts import LLM_API_KEY, LLM_BASE_URL, LLM_MODEL_NAME
+from consts import (LLM_API_KEY, LLM_BACKOFF_BASE_S, LLM_BACKOFF_MAX_S,
+                    LLM_BASE_URL, LLM_DEADLINE_S, LLM_FALLBACKS,
+                    LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_QUANTILE, LLM_HEDGING,
+                    LLM_MAX_CONNECTIONS, LLM_MAX_RETRIES, LLM_MODEL_NAME,
+                    LLM_TIMEOUT_S)
+from metrics import (LLM_ATTEMPT_SECONDS, LLM_EVENTS, STAGE_SECONDS,
+                     record_llm_usage, span)
 
 logger = logging.getLogger(__name__)
 
+# Errors worth retrying on the same model; anything else
+# (bad request, auth, ...) goes straight to the next fallback
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    litellm.Timeout,
+    litellm.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+)
+
+
+@dataclass(frozen=True)
+class LLMEndpoint:
+    """A model and where to call it."""
+    model_name: str
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.model_name}@{self.base_url or 'default'}"
+
+    @classmethod
+    def from_config(cls, config: Dict[str, str]) -> "LLMEndpoint":
+        """E.g. {"model": "ollama/qwen2.5:7b", "base_url": "http://ollama:11434"}"""
+        return cls(model_name=config["model"],
+                   api_key=config.get("api_key"),
+                   base_url=config.get("base_url") or None)
+
+
+@dataclass
+class LLMPolicy:
+    """Timeouts, retries and hedging of LLM calls.
+
+    Every request gets at most `timeout` seconds, and all attempts of one
+    call, fallbacks included, at most `deadline` seconds. A model is tried
+    `1 + max_retries` times with full-jitter exponential backoff before
+    moving on to the next one. With `hedging`, a request slower than the
+    `hedge_quantile` of recent latencies of its model gets a duplicate,
+    and whichever answers first wins.
+    """
+    timeout: float = LLM_TIMEOUT_S
+    deadline: float = LLM_DEADLINE_S
+    max_retries: int = LLM_MAX_RETRIES
+    backoff_base: float = LLM_BACKOFF_BASE_S
+    backoff_max: float = LLM_BACKOFF_MAX_S
+    hedging: bool = LLM_HEDGING
+    hedge_quantile: float = LLM_HEDGE_QUANTILE
+    hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+@dataclass
+class LatencyStats:
+    """Recent request latencies and error count of one endpoint."""
+    window: deque = field(default_factory=lambda: deque(maxlen=500))
+    errors: int = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.window:
+            return None
+        ordered = sorted(self.window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "requests": len(self.window),
+            "errors": self.errors,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+_sessions_lock = threading.Lock()
+
+
+def share_http_sessions(max_connections: int = LLM_MAX_CONNECTIONS) -> None:
+    """Make litellm reuse keep-alive connections instead of opening
+    a new one per call. httpx pools connections per host,
+    so every provider gets its own warm pool."""
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_connections)
+    with _sessions_lock:
+        if litellm.client_session is None:
+            litellm.client_session = httpx.Client(limits=limits)
+        if litellm.aclient_session is None:
+            litellm.aclient_session = httpx.AsyncClient(limits=limits)
+
 
 class LLMCaller:
     """Interface for LLM interaction."""
@@ -18,7 +125,10 @@ class LLMCaller:
             model_name: str = LLM_MODEL_NAME,
             llm_api_key: str = LLM_API_KEY,
             llm_base_url: str = LLM_BASE_URL,
-            prompt: str | None = None):
+            prompt: str | None = None,
+            system_prompt: str | None = None,
+            fallbacks: List[Dict[str, str]] | None = None,
+            policy: LLMPolicy | None = None):
         """
         Parameters
         ----------
@@ -35,11 +145,116 @@ class LLMCaller:
             if running locally "http://localhost:11436", by default LLM_BASE_URL
         prompt : str | None, optional
             Constant prompt for queries, by default None
+        system_prompt : str | None, optional
+            Static instructions sent as the system message before the prompt,
+            kept byte-identical between calls for provider prompt caching,
+            by default None
+        fallbacks : list[dict[str, str]] | None, optional
+            Models tried in order when the main one fails, each
+            {"model": ..., "base_url": ..., "api_key": ...},
+            by default LLM_FALLBACKS
+        policy : LLMPolicy | None, optional
+            Timeouts, retries and hedging, by default from the LLM_* settings
         """
         self.model_name = model_name
         self.llm_api_key = llm_api_key
         self.llm_base_url = llm_base_url
         self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.policy = policy or LLMPolicy()
+        self.endpoints = [LLMEndpoint(model_name, llm_api_key, llm_base_url)] + [
+            LLMEndpoint.from_config(config)
+            for config in (LLM_FALLBACKS if fallbacks is None else fallbacks)]
+        self._stats: Dict[str, LatencyStats] = {
+            endpoint.key: LatencyStats() for endpoint in self.endpoints}
+        share_http_sessions()
+
+    def _attempts(self) -> Iterator[Tuple[LLMEndpoint, int]]:
+        """(endpoint, attempt number) in the order the policy tries them."""
+        for endpoint in self.endpoints:
+            for attempt in range(self.policy.max_retries + 1):
+                yield endpoint, attempt
+
+    def _record(self, endpoint: LLMEndpoint, seconds: float,
+                error: Optional[BaseException] = None) -> None:
+        stats = self._stats[endpoint.key]
+        if error is None:
+            stats.window.append(seconds)
+            LLM_ATTEMPT_SECONDS.observe(seconds, model=endpoint.model_name)
+        else:
+            stats.errors += 1
+            LLM_EVENTS.inc(event=type(error).__name__)
+
+    def latency_stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Latency percentiles and errors of recent requests per endpoint."""
+        return {key: stats.summary() for key, stats in self._stats.items()}
+
+    def _hedge_delay(self, endpoint: LLMEndpoint) -> Optional[float]:
+        """When to send a duplicate request, None if hedging is off
+        or there is not enough history yet."""
+        stats = self._stats[endpoint.key]
+        if (not self.policy.hedging
+                or len(stats.window) < self.policy.hedge_min_samples):
+            return None
+        return stats.quantile(self.policy.hedge_quantile)
+
+    def _on_failure(self, endpoint: LLMEndpoint, attempt: int,
+                    error: BaseException) -> bool:
+        """Log a failed attempt, True if the same endpoint should be retried."""
+        retry = (isinstance(error, RETRYABLE_ERRORS)
+                 and attempt < self.policy.max_retries)
+        logger.warning("LLM %s attempt %d failed (%s: %s), %s",
+                       endpoint.key, attempt + 1, type(error).__name__, error,
+                       "retrying" if retry else "moving on")
+        LLM_EVENTS.inc(event="retry" if retry else "fallback")
+        return retry
+
+    def _request_kwargs(self, endpoint: LLMEndpoint, messages, timeout: float,
+                        **kwargs) -> dict:
+        return dict(model=endpoint.model_name,
+                    messages=messages,
+                    api_key=endpoint.api_key,
+                    api_base=endpoint.base_url,
+                    timeout=timeout,
+                    num_retries=0,
+                    **kwargs)
+
+    def _build_messages(self,
+                        call_params: dict[str, str] | None = None,
+                        prompt: str | None = None) -> list[dict[str, str]]:
+        """Format the prompt into a chat messages list."""
+        if prompt is None:
+            prompt = self.prompt
+        if call_params is None:
+            call_params = {}
+        logger.info(
+            "Calling model with prompt %s (300 symbols):\n", prompt[:300])
+        messages = [{"role": "user",
+                     "content": prompt.format(**call_params)}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        return messages
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens of `text` for the main model."""
+        try:
+            return litellm.token_counter(model=self.model_name, text=text)
+        except Exception:
+            # Rough estimate for Cyrillic text with unknown tokenizers
+            return len(text) // 3
+
+    async def aping(self) -> float:
+        """Send a one-token request to the main model, e.g. to open its
+        connection at startup. Returns the latency, which is not counted
+        in the hedging statistics."""
+        endpoint = self.endpoints[0]
+        start = time.perf_counter()
+        await asyncio.wait_for(
+            litellm.acompletion(**self._request_kwargs(
+                endpoint, [{"role": "user", "content": "ping"}],
+                self.policy.timeout, max_tokens=1)),
+            self.policy.timeout)
+        return time.perf_counter() - start
 
     def call_model(self,
                    call_params: dict[str, str] | None = None,
@@ -58,31 +273,246 @@ class LLMCaller:
         -------
         litellm.ModelResponse
         """
-        if prompt is None:
-            prompt = self.prompt
-        if call_params is None:
-            call_params = {}
-        messages = [{"role": "user",
-                    "content": prompt.format(**call_params)}]
+        messages = self._build_messages(call_params, prompt)
+        with span("llm_call"):
+            response = self._call_with_policy(messages, **kwargs)
         logger.info(
-            "Calling model with prompt %s (300 symbols):\n", prompt[:300])
-        response = litellm.completion(
-            model=self.model_name,
-            messages=messages,
-            api_key=self.llm_api_key,
-            api_base=self.llm_base_url,
-            **kwargs
-        )
+            "Got response for call_params %s (300 symbols):\n %s...",
+            str(call_params), response['choices'][0]['message']['content'][:300])
+        self._log_cost(response)
+        return response
+
+    def _call_with_policy(self, messages, **kwargs) -> litellm.ModelResponse:
+        """Blocking call with timeouts, retries and fallbacks, without hedging."""
+        deadline = time.monotonic() + self.policy.deadline
+        error: BaseException = TimeoutError("LLM deadline exceeded")
+        skip = None
+        for endpoint, attempt in self._attempts():
+            if endpoint == skip:
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            start = time.perf_counter()
+            try:
+                response = litellm.completion(**self._request_kwargs(
+                    endpoint, messages, min(self.policy.timeout, remaining),
+                    **kwargs))
+            except Exception as e:
+                self._record(endpoint, time.perf_counter() - start, e)
+                error = e
+                if self._on_failure(endpoint, attempt, e):
+                    time.sleep(min(self.policy.backoff(attempt),
+                                   max(0.0, deadline - time.monotonic())))
+                else:
+                    skip = endpoint
+                continue
+            self._record(endpoint, time.perf_counter() - start)
+            return response
+        LLM_EVENTS.inc(event="exhausted")
+        raise error
+
+    async def acall_model(self,
+                          call_params: dict[str, str] | None = None,
+                          prompt: str | None = None,
+                          **kwargs) -> litellm.ModelResponse:
+        """Async version of `call_model` built on `litellm.acompletion`.
+
+        Parameters
+        ----------
+        call_params : dict[str, str] | None, optional
+            Parameters to format prompt variables,
+            if empty then set to {}, by default None
+        prompt : str | None, optional
+            Prompt to send, if empty then set to self.prompt, by default None
+
+        Returns
+        -------
+        litellm.ModelResponse
+        """
+        messages = self._build_messages(call_params, prompt)
+        with span("llm_call"):
+            response = await self._acall_with_policy(messages, **kwargs)
         logger.info(
             "Got response for call_params %s (300 symbols):\n %s...",
             str(call_params), response['choices'][0]['message']['content'][:300])
-        logger.info("Total cost %s",  litellm.completion_cost(response))
+        self._log_cost(response)
         return response
 
+    async def _acall_with_policy(self, messages,
+                                 **kwargs) -> litellm.ModelResponse:
+        """Call with timeouts, retries, fallbacks and hedging."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.policy.deadline
+        error: BaseException = asyncio.TimeoutError("LLM deadline exceeded")
+        skip = None
+        for endpoint, attempt in self._attempts():
+            if endpoint == skip:
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                return await self._ahedged(
+                    endpoint, messages, min(self.policy.timeout, remaining),
+                    **kwargs)
+            except Exception as e:
+                error = e
+                if self._on_failure(endpoint, attempt, e):
+                    await asyncio.sleep(min(self.policy.backoff(attempt),
+                                            max(0.0, deadline - loop.time())))
+                else:
+                    skip = endpoint
+        LLM_EVENTS.inc(event="exhausted")
+        raise error
+
+    async def _arequest(self, endpoint: LLMEndpoint, messages, timeout: float,
+                        **kwargs) -> litellm.ModelResponse:
+        """A single request bounded by `timeout`."""
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                litellm.acompletion(**self._request_kwargs(
+                    endpoint, messages, timeout, **kwargs)),
+                timeout)
+        except Exception as e:
+            self._record(endpoint, time.perf_counter() - start, e)
+            raise
+        self._record(endpoint, time.perf_counter() - start)
+        return response
+
+    async def _ahedged(self, endpoint: LLMEndpoint, messages, timeout: float,
+                       **kwargs) -> litellm.ModelResponse:
+        """A request with a duplicate sent once it is slower than usual."""
+        first = asyncio.ensure_future(
+            self._arequest(endpoint, messages, timeout, **kwargs))
+        hedge_delay = self._hedge_delay(endpoint)
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                LLM_EVENTS.inc(event="hedge")
+                logger.info("LLM %s is slower than %.2fs, sending a hedged request",
+                            endpoint.key, hedge_delay)
+                tasks.add(asyncio.ensure_future(self._arequest(
+                    endpoint, messages, timeout - hedge_delay, **kwargs)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream_model(self,
+                            call_params: dict[str, str] | None = None,
+                            prompt: str | None = None,
+                            **kwargs) -> AsyncIterator[str]:
+        """Stream the model answer as text chunks.
+
+        Parameters
+        ----------
+        call_params : dict[str, str] | None, optional
+            Parameters to format prompt variables,
+            if empty then set to {}, by default None
+        prompt : str | None, optional
+            Prompt to send, if empty then set to self.prompt, by default None
+
+        Yields
+        ------
+        str
+            Next piece of the answer text
+        """
+        messages = self._build_messages(call_params, prompt)
+        start = time.perf_counter()
+        response, first_chunk = await self._aopen_stream(messages, **kwargs)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_token")
+        chunks = []
+        with span("llm_stream"):
+            chunk = first_chunk
+            while chunk is not None:
+                chunks.append(chunk)
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+                # A stream that stalls mid-answer fails instead of hanging
+                try:
+                    chunk = await asyncio.wait_for(
+                        response.__anext__(), self.policy.timeout)
+                except StopAsyncIteration:
+                    chunk = None
+
+        full_response = litellm.stream_chunk_builder(chunks, messages=messages)
+        logger.info(
+            "Got streamed response for call_params %s (300 symbols):\n %s...",
+            str(call_params), full_response['choices'][0]['message']['content'][:300])
+        self._log_cost(full_response)
+
+    async def _aopen_stream(self, messages, **kwargs):
+        """Start a stream and wait for its first chunk with the call policy.
+        Once a chunk is shown to the user the answer can't switch models,
+        so retries and fallbacks only cover the time to first token."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.policy.deadline
+        error: BaseException = asyncio.TimeoutError("LLM deadline exceeded")
+        skip = None
+        for endpoint, attempt in self._attempts():
+            if endpoint == skip:
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            timeout = min(self.policy.timeout, remaining)
+
+            async def open_stream():
+                response = await litellm.acompletion(**self._request_kwargs(
+                    endpoint, messages, timeout, stream=True, **kwargs))
+                return response, await response.__anext__()
+
+            start = time.perf_counter()
+            try:
+                return await asyncio.wait_for(open_stream(), timeout)
+            except Exception as e:
+                # Only failures are recorded: time to first token is
+                # not comparable with full answer latencies used for hedging
+                self._record(endpoint, time.perf_counter() - start, e)
+                error = e
+                if self._on_failure(endpoint, attempt, e):
+                    await asyncio.sleep(min(self.policy.backoff(attempt),
+                                            max(0.0, deadline - loop.time())))
+                else:
+                    skip = endpoint
+        LLM_EVENTS.inc(event="exhausted")
+        raise error
+
+    @staticmethod
+    def _log_cost(response: litellm.ModelResponse) -> None:
+        try:
+            cost = litellm.completion_cost(response)
+        except Exception as e:
+            # Models missing from the litellm price map, e.g. local ones
+            logger.debug("Failed to compute LLM cost: %s", e)
+            cost = None
+        logger.info("Total cost %s",  cost)
+        record_llm_usage(response, cost)
+
     @staticmethod
     def get_response_content(response: litellm.ModelResponse) -> str | dict:
+        return LLMCaller.parse_content(
+            response['choices'][0]['message']['content'])
+
+    @staticmethod
+    def parse_content(content: str) -> str | dict:
+        """Decode JSON answers, return plain text as is."""
         try:
-            result = response['choices'][0]['message']['content']
-            return json.loads(result)
+            return json.loads(content)
         except json.JSONDecodeError:
-            return result
+            return content
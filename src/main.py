@@ -1,53 +1,316 @@
 import asyncio
+import html
 import logging
-from aiogram import Bot, Dispatcher, F
+import re
+import time
+from typing import List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message
 from aiogram.filters import Command
 
+from consts import (CONTEXT_CANDIDATES, LLM_STREAMING, METRICS_ENABLED,
+                    STREAM_EDIT_INTERVAL_S)
+from database.embedding_cache import normalize_query
+from llm.context_builder import build_context
+from metrics import CONTEXT_TOKENS, IN_FLIGHT, REQUESTS, span
+from singleflight import SingleFlight
+
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 DEBUG_CONTEXT = False
+STREAM_PLACEHOLDER = "…"
+STREAM_ERROR = "Не удалось получить ответ, попробуйте спросить ещё раз."
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Tags of Telegram's HTML formatting, removed for the plain text fallback
+_HTML_TAG = re.compile(r'</?(?:b|strong|i|em|u|ins|s|strike|del|code|pre|a|'
+                       r'blockquote|tg-spoiler|span)(?:\s[^>]*)?>')
+
+router = Router()
+
+
+@router.message(Command("help"))
+async def help_command(message: Message):
+    await message.answer("Это бот для помощи ведущим спортивной мафии в проведении игр. Задайте ему вопрос по теме мафии и он ответит на него, используя турнирные правила ФСМ.")
+
+
+def format_paragraphs(fragments) -> str:
+    """Show rule fragments as they are, for direct paragraph lookups."""
+    lines = []
+    current_path = None
+    for fr in fragments:
+        full_path = fr['metadata']['full_path']
+        if full_path and full_path != current_path:
+            lines.append(f"<i>{html.escape(full_path)}</i>")
+            current_path = full_path
+        lines.append(f"<b>{html.escape(fr['metadata']['paragraph'])}.</b> "
+                     f"{html.escape(fr['content'])}")
+    links_pretty = "<b>Пункты правил ФСМ:</b>\n" + \
+        ", ".join(fr['metadata']['paragraph'] for fr in fragments)
+
+    text = ""
+    for line in lines:
+        # Leave room for the footer, a long subtree is cut at a whole line
+        if len(text) + len(line) + len(links_pretty) + 10 > TELEGRAM_MESSAGE_LIMIT:
+            text += "…\n"
+            break
+        text += line + "\n"
+    return f"{text}\n{links_pretty}"
+
+
+async def stream_answer(reply: Message, chunks) -> str:
+    """Show a streamed answer by progressively editing `reply`.
+    Edits are sent at most every STREAM_EDIT_INTERVAL_S seconds
+    to stay within Telegram rate limits; if Telegram asks to retry later,
+    edits are skipped until then. Returns the full answer text."""
+    text = ""
+    shown = STREAM_PLACEHOLDER
+    last_edit = time.monotonic()
+    paused_until = float('-inf')
+    async for chunk in chunks:
+        text += chunk
+        now = time.monotonic()
+        if (now - last_edit >= STREAM_EDIT_INTERVAL_S and now >= paused_until
+                and text.strip() != shown):
+            shown = text.strip()
+            # Plain text while streaming: a partial answer may be broken HTML
+            try:
+                with span("telegram_edit"):
+                    await reply.edit_text(shown)
+            except TelegramRetryAfter as e:
+                logging.warning("Streamed message edits are rate limited "
+                                "for %ss", e.retry_after)
+                paused_until = now + e.retry_after
+            except TelegramBadRequest as e:
+                logging.warning("Failed to edit streamed message: %s", e)
+            last_edit = now
+    return text
+
+
+@router.message(F.text)
+async def question_handler(message: Message, rag, llm, answer_cache,
+                           limiter: asyncio.Semaphore,
+                           singleflight: SingleFlight):
+    """Answer a rules question.
+    `rag`, `llm`, `answer_cache`, `limiter` and `singleflight` are injected
+    from the dispatcher workflow data.
+    """
+    IN_FLIGHT.inc()
+    try:
+        with span("question"):
+            await answer_question(message, rag, llm, answer_cache, limiter,
+                                  singleflight)
+    finally:
+        IN_FLIGHT.dec()
+
+
+async def answer_question(message: Message, rag, llm, answer_cache,
+                          limiter: asyncio.Semaphore,
+                          singleflight: SingleFlight):
+    query = message.text
+    # Questions like "что в пункте 6.1.2" are answered with the rules text
+    direct_lookup, cited = await rag.alookup_paragraphs(query)
+    if direct_lookup:
+        REQUESTS.inc(route="paragraph_lookup")
+        with span("telegram_answer"):
+            await message.answer(format_paragraphs(cited), parse_mode="HTML")
+        return
+
+    # Players at one table often send the same question at once:
+    # concurrent identical questions share one retrieval and LLM call
+    (final_answer, reply), shared = await singleflight.do(
+        normalize_query(query),
+        lambda: generate_answer(message, cited, rag, llm, answer_cache, limiter))
+    if shared:
+        REQUESTS.inc(route="singleflight")
+        # The streamed reply belongs to the question that made the call
+        reply = None
+    with span("telegram_answer"):
+        await send_answer(message, reply, final_answer)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Parts of a text that fit in a message, split at line breaks if possible."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    return parts + [text] if text else parts
+
+
+async def send_answer(message: Message, reply: Optional[Message],
+                      text: str) -> None:
+    """Show the final HTML answer in the streamed `reply`, or in a new message.
+
+    If Telegram rejects it (e.g. too long, or broken HTML from the model),
+    the answer is shown as plain text split into several messages.
+    """
+    for attempt in range(2):
+        try:
+            if reply is not None:
+                await reply.edit_text(text, parse_mode="HTML")
+            else:
+                await message.answer(text, parse_mode="HTML")
+            return
+        except TelegramRetryAfter as e:
+            # Streaming edits used up the rate limit, the answer must land
+            if attempt:
+                raise
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            logging.warning("Failed to send the answer as HTML, "
+                            "falling back to plain text: %s", e)
+            break
+
+    parts = split_message(html.unescape(_HTML_TAG.sub("", text)))
+    if reply is not None:
+        await reply.edit_text(parts.pop(0))
+    for part in parts:
+        await message.answer(part)
+
+
+async def generate_answer(message: Message, cited, rag, llm, answer_cache,
+                          limiter: asyncio.Semaphore
+                          ) -> Tuple[str, Optional[Message]]:
+    """Retrieve context and get the LLM answer for a question.
+    Returns the formatted answer and the reply it is being streamed into."""
+    query = message.text
+    # Bound the number of questions in the retrieval/LLM pipeline at once,
+    # so a burst queues here instead of exhausting the executor and the LLM.
+    async with limiter:
+        query_vector, results = await rag.asearch_rules_with_vector(
+            query, k=CONTEXT_CANDIDATES)
+        if cited:
+            cited_ids = {fr['metadata']['paragraph'] for fr in cited}
+            results = cited + [fr for fr in results
+                               if fr['metadata']['paragraph'] not in cited_ids]
+        # Only as many fragments as fit the token budget, headings deduplicated;
+        # paragraphs cited by number are always part of the context
+        context_text, results, context_tokens = build_context(
+            results, llm.count_tokens, keep=max(1, len(cited)))
+        if METRICS_ENABLED:
+            CONTEXT_TOKENS.observe(context_tokens)
+        logging.debug("Context of %r:\n%s", query, context_text)
+
+        paragraph_ids = [fr['metadata']['paragraph'] for fr in results]
+        answer_cache.sync_version(await rag.aget_rules_version())
+        model_answer = answer_cache.get(query_vector, paragraph_ids)
+        REQUESTS.inc(route="llm" if model_answer is None else "answer_cache")
+        reply = None
+        if model_answer is None and LLM_STREAMING:
+            with span("telegram_answer"):
+                reply = await message.answer(STREAM_PLACEHOLDER)
+            try:
+                streamed = await stream_answer(
+                    reply,
+                    llm.astream_model(call_params={"query": query,
+                                                   "context": context_text}))
+            except Exception:
+                # Replace the placeholder or the partial answer,
+                # the error answer is not cached
+                logging.exception("Failed to stream the answer")
+                return STREAM_ERROR, reply
+            model_answer = llm.parse_content(streamed)
+            answer_cache.put(query_vector, paragraph_ids, model_answer)
+        elif model_answer is None:
+            response = await llm.acall_model(
+                call_params={"query": query,
+                             "context": context_text})
+            model_answer = llm.get_response_content(response)
+            answer_cache.put(query_vector, paragraph_ids, model_answer)
+
+    links_pretty = "<b>Релевантные пункты правил ФСМ:</b>\n" + \
+        ", ".join([fr['metadata']['paragraph'] for fr in results])
+    final_answer = f"{model_answer}\n\n{links_pretty}"
+
+    if DEBUG_CONTEXT:
+        context_pretty = "\t • " + "\n\t • ".join(context_text.split("\n"))
+        final_answer = f"{model_answer}\n\n<b>Получено на основе фрагментов правил:</b>\n{context_pretty}\n\n{links_pretty}"
+    return final_answer, reply
+
+
+def load_services(state, check_compatibility: bool):
+    """Import and create the RAG and LLM clients, timing each stage.
+    Blocking, run it off the event loop."""
+    with state.stage("import_rag"):
+        from database.fragments_db import RAGInterface
+    with state.stage("import_llm"):
+        from llm.llm_interface import LLMCaller
+        from llm.prompt import MAFIA_PROMPT, MAFIA_SYSTEM_PROMPT
+    with state.stage("init_rag"):
+        rag = RAGInterface()
+    if check_compatibility and rag.embedding_backend != "huggingface":
+        # Refuse to answer from a collection embedded by an incompatible model
+        with state.stage("embedding_compatibility"):
+            rag.check_embedding_compatibility()
+    with state.stage("init_llm"):
+        llm = LLMCaller(prompt=MAFIA_PROMPT, system_prompt=MAFIA_SYSTEM_PROMPT)
+    return rag, llm
 
 
 async def main():
-    from consts import TELEGRAM_BOT_TOKEN
-    from database.fragments_db import RAGInterface
-    from llm.llm_interface import LLMCaller
-    from llm.prompt import MAFIA_PROMPT
+    from consts import (ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_SIZE,
+                        ANSWER_CACHE_TTL_S, BOT_MODE, HEALTH_ENABLED,
+                        HEALTH_HOST, HEALTH_PORT, MAX_CONCURRENT_REQUESTS,
+                        METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+                        TELEGRAM_BOT_TOKEN, WARMUP_ENABLED)
+    from llm.answer_cache import AnswerCache
+    from metrics import register_gauge, start_metrics_server
+    from startup import StartupState, start_health_server, warm_up
 
-    rag = RAGInterface()
-    llm = LLMCaller(prompt=MAFIA_PROMPT)
+    state = StartupState()
+    if HEALTH_ENABLED:
+        await start_health_server(state, HEALTH_HOST, HEALTH_PORT)
+    # Heavy imports run in a thread, so health checks are answered meanwhile;
+    # the warm-up checks compatibility itself
+    rag, llm = await asyncio.to_thread(
+        load_services, state, check_compatibility=not WARMUP_ENABLED)
+    state.rag = rag
+    warmup = (asyncio.create_task(warm_up(state, rag, llm))
+              if WARMUP_ENABLED else None)
+
+    answer_cache = AnswerCache(
+        similarity_threshold=ANSWER_CACHE_SIMILARITY,
+        ttl=ANSWER_CACHE_TTL_S,
+        max_size=ANSWER_CACHE_SIZE)
 
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    dp = Dispatcher()
-
-    @dp.message(Command("help"))
-    async def help_command(message: Message):
-        await message.answer("Это бот для помощи ведущим спортивной мафии в проведении игр. Задайте ему вопрос по теме мафии и он ответит на него, используя турнирные правила ФСМ.")
-
-    @dp.message(F.text)
-    async def question_handler(message: Message):
-        query = message.text
-        results = rag.search_rules(query, k=3)
-        context_text = "\n".join(rag.process_fragment(fr) for fr in results)
-        print(context_text)
-        response = llm.call_model(
-            call_params={"query": query,
-                         "context": context_text})
-        model_answer = llm.get_response_content(response)
-
-        links_pretty = "<b>Релевантные пункты правил ФСМ:</b>\n" + \
-            ", ".join([fr['metadata']['paragraph'] for fr in results])
-        final_answer = f"{model_answer}\n\n{links_pretty}"
-
-        if DEBUG_CONTEXT:
-            context_pretty = "\t • " + "\n\t • ".join(context_text.split("\n"))
-            final_answer = f"{model_answer}\n\n<b>Получено на основе фрагментов правил:</b>\n{context_pretty}\n\n{links_pretty}"
-        await message.answer(final_answer,
-                             parse_mode="HTML")
-
-    await dp.start_polling(bot)
+    dp = Dispatcher(
+        rag=rag,
+        llm=llm,
+        answer_cache=answer_cache,
+        limiter=asyncio.Semaphore(MAX_CONCURRENT_REQUESTS),
+        singleflight=SingleFlight())
+    dp.include_router(router)
+
+    if METRICS_ENABLED:
+        register_gauge("mafia_query_embedding_cache_hit_ratio",
+                       "Hit ratio of the query embedding cache",
+                       lambda: rag.query_cache.stats()["hit_ratio"])
+        register_gauge("mafia_answer_cache_hit_ratio",
+                       "Hit ratio of the LLM answer cache",
+                       lambda: answer_cache.stats()["hit_ratio"])
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    # Questions are taken only once the models are warm
+    if warmup is not None:
+        await warmup
+    else:
+        state.mark_ready()
+    if not state.ready:
+        # Don't answer from a broken pipeline, let the supervisor restart us
+        raise RuntimeError(f"Warm-up failed, not starting the bot: {state.checks}")
+
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,226 @@
+"""Lightweight in-process metrics with a Prometheus text endpoint.
+
+When metrics are disabled every recording call returns right away,
+so instrumentation can stay in the hot path.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from consts import METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Value that goes up and down, or is read from a callback at scrape time."""
+
+    def __init__(self, name: str, description: str,
+                 callback: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.description = description
+        self.callback = callback
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} gauge"]
+        if self.callback is not None:
+            lines.append(f"{self.name} {self.callback()}")
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    def __init__(self, name: str, description: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # label set -> [bucket counts (last one is +Inf), sum]
+        self._series: Dict[LabelKey, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else str(bound)
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "mafia_stage_seconds", "Latency of pipeline stages"))
+REQUESTS = REGISTRY.register(Counter(
+    "mafia_requests_total", "Answered questions by route"))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "mafia_in_flight_requests", "Questions being processed"))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "mafia_llm_tokens_total", "LLM tokens by kind"))
+LLM_COST = REGISTRY.register(Counter(
+    "mafia_llm_cost_total", "LLM cost reported by litellm"))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "mafia_context_tokens", "Tokens of rule fragments sent to the LLM",
+    buckets=(100, 200, 400, 600, 800, 1000, 1500, 2000, 3000, 4000)))
+LLM_ATTEMPT_SECONDS = REGISTRY.register(Histogram(
+    "mafia_llm_attempt_seconds", "Latency of single LLM requests by model"))
+LLM_EVENTS = REGISTRY.register(Counter(
+    "mafia_llm_events_total", "LLM retries, fallbacks, hedges and failures"))
+WEBHOOK_UPDATES = REGISTRY.register(Counter(
+    "mafia_webhook_updates_total", "Webhook updates by outcome"))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "mafia_startup_seconds", "Duration of startup stages"))
+
+
+@contextmanager
+def _timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+_NOOP = nullcontext()
+
+
+def span(stage: str):
+    """Context manager timing a pipeline stage, a shared no-op when disabled.
+    E.g. `with span("embedding"): ...`"""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _timed(stage)
+
+
+def register_gauge(name: str, description: str,
+                   callback: Callable[[], float]) -> None:
+    """Expose a value read at scrape time, e.g. a cache hit ratio."""
+    REGISTRY.register(Gauge(name, description, callback=callback))
+
+
+def record_llm_usage(response, cost: Optional[float]) -> None:
+    """Count tokens and cost of a litellm response."""
+    if not METRICS_ENABLED:
+        return
+    usage = getattr(response, 'usage', None)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            LLM_TOKENS.inc(tokens, kind=kind)
+    if cost:
+        LLM_COST.inc(cost)
+
+
+async def start_metrics_server(host: str, port: int):
+    """Serve `/metrics` in the Prometheus text format.
+    Returns the aiohttp runner, call `cleanup()` on it to stop."""
+    from aiohttp import web
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(),
+                            content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
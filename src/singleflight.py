@@ -0,0 +1,47 @@
+"""Coalescing of identical concurrent calls."""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Run one call per key at a time and share its result.
+
+    A caller arriving while a call with the same key is in flight does not
+    start another one, it waits for that call and gets the same result or
+    exception. Results are not kept after the call completes, so this is not
+    a cache: it only removes duplicate work during bursts.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable,
+                 fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Result of `fn()` for `key` and whether it was shared
+        with a call started by another caller."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            # The call runs in its own task, so a cancelled caller
+            # (including the one that started it) does not cancel it for others
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,172 @@
+"""Bot startup: timed stages, warm-up and the health/readiness endpoint.
+
+Heavy modules (chromadb, litellm, the embedding model) are loaded off the
+event loop, so `/health` answers from the first second. The warm-up then
+loads the embedding model and runs one request through every stage of the
+pipeline: the first user question doesn't pay for model loading, lazy index
+builds and cold connections.
+
+- `GET /health` – liveness, always 200 while the process runs,
+  with the startup state and stage timings
+- `GET /ready` – 200 once the warm-up passed and the vector store answers,
+  503 otherwise
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from aiohttp import web
+
+from consts import CHROMA_TIMEOUT_S
+from metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = "Что происходит после трёх фолов у игрока?"
+WARMUP_LOOKUP = "пункт 1"
+
+
+class StartupState:
+    """Progress of the bot startup, shown by the health endpoint."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.timings: Dict[str, float] = {}
+        # component -> "pending", "ok" or the error
+        self.checks: Dict[str, str] = {
+            "embeddings": "pending", "search": "pending", "llm": "pending"}
+        self.rag = None
+        self.ready = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a startup stage, e.g. `with state.stage("import_rag"): ...`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = round(seconds, 3)
+            STARTUP_SECONDS.inc(seconds, stage=name)
+            logger.info("Startup stage %s took %.2fs", name, seconds)
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        total = time.monotonic() - self.started_at
+        self.timings["total"] = round(total, 3)
+        logger.info("Bot is ready in %.2fs, stages: %s", total, self.timings)
+
+    def status(self) -> str:
+        if self.ready:
+            return "ready"
+        if any(check not in ("pending", "ok") for check in self.checks.values()):
+            return "failed"
+        return "starting"
+
+
+async def _check(state: StartupState, name: str, coro) -> bool:
+    """Run a warm-up step, recording its time and outcome."""
+    with state.stage(f"warmup_{name}"):
+        try:
+            await coro
+        except Exception as e:
+            logger.exception("Warm-up of %s failed", name)
+            state.checks[name] = f"error: {e!r}"
+            return False
+    state.checks[name] = "ok"
+    return True
+
+
+async def warm_up(state: StartupState, rag, llm) -> None:
+    """Load the models and run a dummy question through the pipeline.
+
+    The bot is ready when embeddings and search work; a failed LLM ping is
+    only reported, since the LLM client retries and falls back on its own.
+
+    Raises
+    ------
+    ValueError
+        If the embedding backend is incompatible with the stored vectors,
+        the bot must not answer from such a collection
+    """
+    if rag.embedding_backend != "huggingface":
+        with state.stage("warmup_compatibility"):
+            await asyncio.to_thread(rag.check_embedding_compatibility)
+
+    async def embeddings_and_search():
+        embedding = []
+
+        def encode():
+            # Straight to the model: the dummy query must not enter the cache
+            embedding.extend(rag.embeddings.embed_query(WARMUP_QUERY))
+
+        if not await _check(state, "embeddings", asyncio.to_thread(encode)):
+            return
+
+        async def search():
+            # Fragment store, paragraph and lexical indexes are built lazily
+            await asyncio.to_thread(rag.lookup_paragraphs, WARMUP_LOOKUP)
+            await asyncio.to_thread(rag.search_rules_lexical, WARMUP_QUERY, 1)
+            await rag.asearch_rules_by_vector(embedding, 1)
+
+        await _check(state, "search", search())
+
+    async def llm_ping():
+        await asyncio.to_thread(llm.count_tokens, WARMUP_QUERY)
+        await llm.aping()
+
+    await asyncio.gather(embeddings_and_search(), _check(state, "llm", llm_ping()))
+    if state.checks["embeddings"] == "ok" and state.checks["search"] == "ok":
+        state.mark_ready()
+    else:
+        logger.error("Warm-up failed, the bot is not ready: %s", state.checks)
+
+
+async def _backend_health(rag) -> Optional[str]:
+    """Error of the vector store heartbeat, None if it answers."""
+    try:
+        await asyncio.wait_for(asyncio.to_thread(rag.healthcheck),
+                               CHROMA_TIMEOUT_S)
+    except Exception as e:
+        return repr(e)
+    return None
+
+
+def create_app(state: StartupState) -> web.Application:
+
+    def payload() -> dict:
+        return {
+            "status": state.status(),
+            "uptime_s": round(time.monotonic() - state.started_at, 3),
+            "checks": state.checks,
+            "timings": state.timings,
+        }
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(payload())
+
+    async def ready(request: web.Request) -> web.Response:
+        body = payload()
+        if not state.ready:
+            return web.json_response(body, status=503)
+        error = await _backend_health(state.rag)
+        body["vector_store"] = error or "ok"
+        return web.json_response(body, status=503 if error else 200)
+
+    app = web.Application()
+    app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    return app
+
+
+async def start_health_server(state: StartupState, host: str,
+                              port: int) -> web.AppRunner:
+    """Serve `/health` and `/ready`.
+    Returns the aiohttp runner, call `cleanup()` on it to stop."""
+    runner = web.AppRunner(create_app(state))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving health checks on http://%s:%d/health", host, port)
+    return runner
@@ -0,0 +1,156 @@
+"""Webhook mode: updates are received over HTTP and answered by a worker pool.
+
+The HTTP handler only validates an update and puts it into a bounded queue,
+so Telegram gets its response right away. When the queue is full the
+handler answers 503 and Telegram redelivers the update later, instead of
+the request timing out while the bot is busy. Several bot replicas can
+serve one webhook URL behind a load balancer.
+
+On SIGTERM/SIGINT the server stops accepting updates, workers finish
+the queued ones (up to WEBHOOK_DRAIN_TIMEOUT_S) and the process exits.
+The webhook itself is left registered, so Telegram keeps new updates
+until the bot is back.
+"""
+import asyncio
+import hmac
+import logging
+import signal
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from consts import (METRICS_ENABLED, WEBHOOK_BASE_URL, WEBHOOK_DRAIN_TIMEOUT_S,
+                    WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT,
+                    WEBHOOK_QUEUE_SIZE, WEBHOOK_SECRET, WEBHOOK_WORKERS)
+from metrics import WEBHOOK_UPDATES, register_gauge
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateQueue:
+    """Bounded queue of updates processed by a fixed pool of worker tasks."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot,
+                 workers: int = WEBHOOK_WORKERS,
+                 max_size: int = WEBHOOK_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.accepting = False
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self.accepting = True
+        self._tasks = [asyncio.create_task(self._work(), name=f"webhook-worker-{i}")
+                       for i in range(self.workers)]
+
+    def offer(self, update: Update) -> bool:
+        """Queue an update, False if the queue is full or draining."""
+        if not self.accepting:
+            return False
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT_S) -> None:
+        """Stop accepting updates, wait for queued ones and stop the workers."""
+        self.accepting = False
+        pending = self.queue.qsize()
+        if pending:
+            logger.info("Draining %d queued updates", pending)
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out, %d updates are dropped",
+                           self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def create_app(updates: UpdateQueue, secret: Optional[str] = WEBHOOK_SECRET,
+               path: str = WEBHOOK_PATH) -> web.Application:
+
+    async def handle_update(request: web.Request) -> web.Response:
+        # Constant-time comparison, so the secret can't be guessed by timing
+        if secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, "").encode('utf-8'),
+                secret.encode('utf-8')):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(
+                await request.json(), context={"bot": updates.bot})
+        except ValueError:
+            logger.warning("Malformed webhook update")
+            return web.Response(status=400)
+        if not updates.offer(update):
+            WEBHOOK_UPDATES.inc(outcome="rejected")
+            logger.warning("Update queue is full, rejecting update %s",
+                           update.update_id)
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        WEBHOOK_UPDATES.inc(outcome="queued")
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot,
+                      host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                      base_url: Optional[str] = WEBHOOK_BASE_URL) -> None:
+    """Serve the webhook until SIGTERM/SIGINT, then drain gracefully."""
+    if not base_url:
+        raise ValueError("WEBHOOK_BASE_URL is required in webhook mode")
+
+    updates = UpdateQueue(dp, bot)
+    if METRICS_ENABLED:
+        register_gauge("mafia_webhook_queue_size",
+                       "Webhook updates waiting for a worker",
+                       updates.queue.qsize)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    updates.start()
+    runner = web.AppRunner(create_app(updates))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(
+        url=base_url.rstrip('/') + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(100, WEBHOOK_WORKERS * 2))
+    logger.info("Serving webhook on %s:%d%s with %d workers",
+                host, port, WEBHOOK_PATH, updates.workers)
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Shutting down webhook server")
+        # Updates arriving during the drain get 503 and are redelivered
+        updates.accepting = False
+        await updates.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bot.session.close()
@@ -0,0 +1,6 @@
+import os
+
+# Settings `consts` requires, tests never connect to Chroma
+os.environ.setdefault("CHROMA_PORT", "8000")
+os.environ.setdefault("EMBEDDING_DIMENSION", "1024")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
@@ -0,0 +1,91 @@
+import pytest
+
+from database import fragments_db
+from database.fragments_db import RAGInterface
+from database.lexical_index import LexicalIndex
+
+# Fragments of equal length, so each is of the average length
+DOCUMENTS = ["alpha beta gamma", "delta epsilon zeta", "alpha theta iota",
+             "kappa lambda omicron"]
+
+
+@pytest.fixture(scope="module")
+def index() -> LexicalIndex:
+    ids = [str(row) for row in range(len(DOCUMENTS))]
+    return LexicalIndex.build(ids, DOCUMENTS, [{} for _ in DOCUMENTS])
+
+
+def test_full_match_has_confidence_one(index):
+    (row, score, confidence), = index.search("delta epsilon", k=1)
+    assert row == 1
+    assert confidence == pytest.approx(1.0, rel=1e-5)
+
+
+def test_partial_and_unknown_words_lower_confidence(index):
+    _, _, partial = index.search("delta kappa", k=1)[0]
+    _, _, unknown = index.search("delta unknownword", k=1)[0]
+    assert 0.0 < partial < 1.0
+    assert 0.0 < unknown < 1.0
+
+
+def test_no_match(index):
+    assert index.search("unknownword", k=3) == []
+
+
+def results(*confidences):
+    return [{"relevance_score": confidence} for confidence in confidences]
+
+
+@pytest.fixture
+def thresholds(monkeypatch):
+    monkeypatch.setattr(fragments_db, "LEXICAL_FAST_PATH_CONFIDENCE", 0.8)
+    monkeypatch.setattr(fragments_db, "LEXICAL_FAST_PATH_MARGIN", 0.2)
+
+
+@pytest.mark.parametrize("confidences, k, confident", [
+    ((1.0, 0.5, 0.4), 3, True),    # full match, clear lead
+    ((0.8, 0.64, 0.1), 3, True),   # lead of exactly the margin
+    ((1.0, 0.9, 0.4), 3, False),   # a close runner-up
+    ((0.7, 0.1, 0.1), 3, False),   # below the threshold
+    ((1.0, 0.1), 3, False),        # fewer hits than requested
+    ((1.0,), 1, True),
+])
+def test_is_confident(thresholds, confidences, k, confident):
+    assert RAGInterface._is_confident(results(*confidences), k) is confident
+
+
+def test_exact_term_query_is_confident(thresholds, index):
+    hits = index.search("kappa lambda omicron", k=3)
+    assert RAGInterface._is_confident(results(*(c for _, _, c in hits)), 1)
+    hits = index.search("alpha", k=3)
+    assert not RAGInterface._is_confident(results(*(c for _, _, c in hits)), 1)
+
+
+def test_confident_query_skips_embedding(tmp_path, thresholds, monkeypatch):
+    import numpy as np
+
+    from database.embedding_artifact import EmbeddingArtifact
+
+    # The model is loaded lazily, a local index never needs it here
+    rag = RAGInterface(backend="local", artifact_path=None,
+                       local_index_path=str(tmp_path / "index"))
+    rag.lexical_index_path = str(tmp_path / "lexical")
+    ids = [str(row) for row in range(len(DOCUMENTS))]
+    rag.load_artifact(EmbeddingArtifact(
+        model_name="test", dimension=len(DOCUMENTS), ids=ids,
+        documents=DOCUMENTS,
+        metadatas=[{"paragraph": id_, "full_path": ""} for id_ in ids],
+        embeddings=np.eye(len(DOCUMENTS), dtype=np.float16)))
+    embedded = []
+
+    def embed_query(query):
+        embedded.append(query)
+        return [1.0, 0.0, 0.0, 0.0]
+
+    monkeypatch.setattr(rag, "embed_query", embed_query)
+    results = rag.search_rules("kappa lambda omicron", k=1, mode="hybrid")
+    assert [r["metadata"]["paragraph"] for r in results] == ["3"]
+    assert embedded == []
+
+    rag.search_rules("alpha", k=1, mode="hybrid")
+    assert embedded == ["alpha"]
@@ -0,0 +1,54 @@
+import pytest
+
+from database.fragment_store import FragmentStore, split_paragraph
+from database.paragraph_index import ParagraphIndex
+
+IDS = ["1", "4", "4.3", "4.3.1", "4.3.2", "4.4", "5", "7",
+       "ЮФО 4", "ЮФО 4.3", "ЮФО 4.3.1", "Комментарий СК ФСМ #12345678"]
+
+
+@pytest.fixture(scope="module")
+def index() -> ParagraphIndex:
+    store = FragmentStore(IDS, [f"текст {id_}" for id_ in IDS],
+                          [{"full_path": ""} for _ in IDS])
+    return ParagraphIndex(store)
+
+
+@pytest.mark.parametrize("query, references, direct", [
+    ("что в пункте 4.3", ["4.3"], True),
+    ("покажи 4.3 и 4.4", ["4.3", "4.4"], True),
+    ("пункты 4.3, 4.4", ["4.3", "4.4"], True),
+    ("правило 4.3 или 4.4?", ["4.3", "4.4"], True),
+    ("пункты 1, 4 и 7", ["1", "4", "7"], True),
+    ("п. 4.3", ["4.3"], True),
+    ("игрок 5 и 7", [], False),
+    ("покажи 4.3 и объясни", ["4.3"], False),
+    ("почему в 4.3 так написано?", ["4.3"], False),
+    ("покажи ЮФО 4.3", ["ЮФО 4.3"], True),
+    ("что в юфо 4", ["ЮФО 4"], True),
+    ("покажи 4.3 и ЮФО 4.3", ["ЮФО 4.3", "4.3"], True),
+    ("покажи 9.9", [], False),
+])
+def test_lookup(index, query, references, direct):
+    assert index.find_references(query) == references
+    assert index.is_direct_lookup(query) is direct
+
+
+def paragraphs(results):
+    return [result["metadata"]["paragraph"] for result in results]
+
+
+def test_subtree_keeps_documents_apart(index):
+    assert paragraphs(index.subtree("4")) == ["4", "4.3", "4.3.1", "4.3.2", "4.4"]
+    assert paragraphs(index.subtree("ЮФО 4")) == ["ЮФО 4", "ЮФО 4.3", "ЮФО 4.3.1"]
+    assert paragraphs(index.subtree("4.3")) == ["4.3", "4.3.1", "4.3.2"]
+
+
+@pytest.mark.parametrize("paragraph, parts", [
+    ("4.3", ("", (4, 3))),
+    ("ЮФО 4.3", ("ЮФО ", (4, 3))),
+    ("rules 2024 4.3", ("rules 2024 ", (4, 3))),
+    ("Комментарий СК ФСМ #12345678", None),
+])
+def test_split_paragraph(paragraph, parts):
+    assert split_paragraph(paragraph) == parts